@@ -0,0 +1,87 @@
+"""Compares image.crop_transparency with the implementation it replaced.
+
+Usage (from the project root): python benchmarks/crop_transparency.py [--runs N]"""
+
+import argparse
+import importlib.util
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# load the module directly: importing the `bot` package would start the whole bot
+IMAGE_MODULE_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "bot", "utils", "helpers", "image.py")
+spec = importlib.util.spec_from_file_location("image", IMAGE_MODULE_PATH)
+image = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(image)
+
+
+def legacy_crop_transparency(im):
+    image_data = np.asarray(im)
+    try:
+        image_data_bw = image_data[:, :, 3]
+    except IndexError:
+        return im.copy()
+
+    non_empty_columns = np.where(image_data_bw.max(axis=0) == 255)[0]
+    non_empty_rows = np.where(image_data_bw.max(axis=1) == 255)[0]
+
+    crop_box = (min(non_empty_rows), max(non_empty_rows), min(non_empty_columns), max(non_empty_columns))
+
+    image_data_new = image_data[crop_box[0]:crop_box[1] + 1, crop_box[2]:crop_box[3] + 1, :]
+
+    return Image.fromarray(image_data_new)
+
+
+def sticker_like_image(size: int, mode: str = "RGBA"):
+    # an opaque shape surrounded by almost-transparent pixels, like many stickers
+    im = Image.new("RGBA", (size, size), (255, 255, 255, 3))
+    draw = ImageDraw.Draw(im)
+    draw.ellipse((size // 8, size // 5, size - size // 6, size - size // 10), fill=(200, 30, 30, 255))
+
+    if mode == "P":
+        # png files with a palette store the transparency of each palette entry in the tRNS chunk
+        png_file = io.BytesIO()
+        im.quantize(method=Image.FASTOCTREE).save(png_file, "png")
+        return Image.open(png_file)
+    elif mode == "LA":
+        return im.convert("LA")
+
+    return im
+
+
+def bench(func, im, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(im)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    print("{:<6} {:<5} {:>12} {:>12} {:>8}".format("size", "mode", "legacy (ms)", "new (ms)", "speedup"))
+    for size in (512, 4096):
+        for mode in ("RGBA", "LA", "P"):
+            im = sticker_like_image(size, mode)
+            im.load()
+
+            new_ms = bench(image.crop_transparency, im, args.runs)
+            if mode == "RGBA":
+                assert legacy_crop_transparency(im).size == image.crop_transparency(im).size
+                legacy_ms = bench(legacy_crop_transparency, im, args.runs)
+                print("{:<6} {:<5} {:>12.2f} {:>12.2f} {:>7.1f}x".format(size, mode, legacy_ms, new_ms, legacy_ms / new_ms))
+            else:
+                # the legacy implementation does not crop these modes
+                print("{:<6} {:<5} {:>12} {:>12.2f} {:>8}".format(size, mode, "-", new_ms, "-"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compares the encoder profiles of image.ENCODER_PROFILES, and a few other encoder settings we considered for them:
+encoding time and size of the encoded file, for each output format.
+
+The images are the ones the encoder receives in the bot: already resized to 100 px (custom emojis) or 512 px
+(stickers), with a drawing-like content and with a photo-like (noisy) content.
+
+Usage (from the project root): python benchmarks/encoder_profiles.py [--runs N] [--output FILE]"""
+
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+from PIL import Image
+
+# benchmarks/ is the first entry of sys.path when this file is executed
+from image_pipeline import image, generate_image
+
+# settings that are not used by any profile, measured to show why
+OTHER_SETTINGS = {
+    "png_level1": {"png": dict(compress_level=1)},
+    "webp_method2": {"webp": dict(method=2)},
+    "webp_method6": {"webp": dict(method=6)},
+    "webp_lossless": {"webp": dict(lossless=True, quality=100)},
+}
+
+
+def photo_like(im: Image.Image) -> Image.Image:
+    # noise makes images much harder to compress, like photos
+    rgb = np.asarray(im.convert("RGBA")).astype(np.int16)
+    noise = np.random.default_rng(0).normal(0, 12, rgb.shape[:2] + (3,)).astype(np.int16)
+    rgb[..., :3] = np.clip(rgb[..., :3] + noise, 0, 255)
+    return Image.fromarray(rgb.astype(np.uint8), "RGBA")
+
+
+def bench(im: Image.Image, image_format: str, settings: dict, runs: int) -> tuple:
+    timings = []
+    size = 0
+    for _ in range(runs):
+        out = io.BytesIO()
+        start = time.perf_counter()
+        # same as image.encode() without a max file size
+        im.save(out, image_format, **settings)
+        size = out.tell()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings) * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="also save the results to this json file")
+    args = parser.parse_args()
+
+    results = []
+    candidates = {**image.ENCODER_PROFILES, **OTHER_SETTINGS}
+
+    print("{:<8} {:<8} {:<7} {:<14} {:>10} {:>10}".format("content", "size", "format", "settings", "time (ms)", "bytes"))
+    for content in ("drawing", "photo"):
+        for size in (100, 512):
+            im = generate_image(size, "square", "RGBA")
+            if content == "photo":
+                im = photo_like(im)
+
+            for image_format in ("webp", "png"):
+                for name, settings in candidates.items():
+                    if image_format not in settings:
+                        continue
+
+                    encode_ms, encoded_size = bench(im, image_format, settings[image_format], args.runs)
+                    results.append(dict(
+                        content=content,
+                        size=size,
+                        format=image_format,
+                        settings=name,
+                        time_ms=round(encode_ms, 3),
+                        bytes=encoded_size
+                    ))
+                    print("{:<8} {:<8} {:<7} {:<14} {:>10.2f} {:>10}".format(
+                        content, size, image_format, name, encode_ms, encoded_size
+                    ))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
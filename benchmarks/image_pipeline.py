@@ -0,0 +1,305 @@
+"""Benchmarks the image helpers on a generated corpus, using the same image.Options the handlers use.
+
+Every image of the corpus is processed `--runs` times by each benchmark. For each benchmark and image, the throughput
+(images per second), the median and p95 latency and the peak memory are written to a json file, so the results
+of two versions of the helpers can be compared.
+
+Images that make a benchmark fail are reported with an `error` field instead of the measurements.
+
+Peak memory is the increase of the process' peak RSS while the benchmark runs (Pillow's buffers are not tracked
+by tracemalloc). It is accurate only on Linux, where the peak can be reset through /proc/self/clear_refs.
+To measure it, glibc is told to return large buffers to the OS when they are freed, which makes all the timings
+slightly slower: compare only results produced by this script.
+
+Usage (from the project root): python benchmarks/image_pipeline.py [--runs N] [--sizes 64,512] [--only NAME] [--output FILE]"""
+
+import argparse
+import ctypes
+import importlib.util
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+import PIL
+from PIL import Image, ImageDraw
+
+# load the module directly: importing the `bot` package would start the whole bot
+IMAGE_MODULE_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "bot", "utils", "helpers", "image.py")
+spec = importlib.util.spec_from_file_location("image", IMAGE_MODULE_PATH)
+image = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(image)
+
+MAX_STATIC_STICKER_FILE_SIZE = 512 * 1024  # constants.stickers
+
+SIZES = (64, 512, 1024, 4096)
+SHAPES = {
+    "square": (1, 1),
+    "wide": (1, 2),  # height is half the width
+    "tall": (2, 1),  # width is half the height
+}
+MODES = ("RGBA", "RGB", "P")
+
+# the options used by the handlers (see StickerFile.prepare_static_sticker, /toemoji and /tofile),
+# and the format of the files they receive: the format of documents is kept, stickers are webp files
+OPTIONS = {
+    "add_png_document": (image.Options(image_format="png", max_size=512, max_file_size=MAX_STATIC_STICKER_FILE_SIZE, encoder_profile="small"), "png"),
+    "add_webp_document": (image.Options(image_format="webp", max_size=512, max_file_size=MAX_STATIC_STICKER_FILE_SIZE, encoder_profile="small"), "webp"),
+    "toemoji": (image.Options(max_size=100, square=True, keep_aspect_rateo=True, encoder_profile="small"), "webp"),
+    "toemoji_crop": (image.Options(max_size=100, square=True, keep_aspect_rateo=True, crop_transparent_areas=True, encoder_profile="small"), "webp"),
+    "toemoji_ignore_rateo": (image.Options(max_size=100, square=True, keep_aspect_rateo=False, encoder_profile="small"), "webp"),
+    "toemoji_crop_ignore_rateo": (image.Options(max_size=100, square=True, keep_aspect_rateo=False, crop_transparent_areas=True, encoder_profile="small"), "webp"),
+    "tofile_png": (image.Options(image_format="png"), "webp"),
+}
+
+
+def generate_image(size: int, shape: str, mode: str) -> Image.Image:
+    """a sticker-like image: a shaded shape on a (transparent, if the mode supports it) background"""
+
+    height_divisor, width_divisor = SHAPES[shape]
+    width, height = size // width_divisor, size // height_divisor
+
+    # smooth gradients compress like real drawings, random noise would make png encoding unrealistically slow
+    gradient_x = np.linspace(0, 255, width, dtype=np.float32)
+    gradient_y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.empty((height, width, 4), dtype=np.uint8)
+    pixels[..., 0] = gradient_x
+    pixels[..., 1] = gradient_y
+    pixels[..., 2] = (gradient_x + gradient_y) / 2
+    pixels[..., 3] = 0
+
+    im = Image.fromarray(pixels, "RGBA")
+    mask = Image.new("L", (width, height), 0)
+    ImageDraw.Draw(mask).ellipse((width // 8, height // 6, width - width // 5, height - height // 10), fill=255)
+    im.putalpha(mask)
+
+    if mode == "RGB":
+        background = Image.new("RGBA", im.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, im).convert("RGB")
+    elif mode == "P":
+        # the palette entries used by transparent pixels are saved in the tRNS chunk
+        return im.quantize(method=Image.FASTOCTREE)
+
+    return im
+
+
+def generate_corpus(sizes) -> list:
+    corpus = []
+    for size in sizes:
+        for shape in SHAPES:
+            for mode in MODES:
+                im = generate_image(size, shape, mode)
+                # stickers are webp files, documents are usually png files. Webp has no palette mode
+                input_formats = ("png",) if mode == "P" else ("png", "webp")
+                for input_format in input_formats:
+                    encoded = io.BytesIO()
+                    im.save(encoded, input_format, **({"lossless": True} if input_format == "webp" else {}))
+                    corpus.append(dict(
+                        name=f"{size}-{shape}-{mode}-{input_format}",
+                        size=size,
+                        shape=shape,
+                        mode=mode,
+                        input_format=input_format,
+                        dimensions=im.size,
+                        data=encoded.getvalue()
+                    ))
+    return corpus
+
+
+def process_file(data: bytes, options) -> int:
+    # files that will be uploaded are processed only if Telegram would reject them (see StickerFile.prepare_static_sticker())
+    if options.max_file_size and not image.get_sticker_issues(io.BytesIO(data), len(data), options):
+        return 0
+
+    # same steps of imagepool.ImagePool._process_locally()
+    im = image.File(io.BytesIO(data), options)
+    im.process()
+    result_size = im.result_size
+    im.close()
+
+    return result_size
+
+
+def decode(data: bytes) -> Image.Image:
+    im = Image.open(io.BytesIO(data))
+    im.load()
+    return im
+
+
+def helper_benchmarks() -> dict:
+    """benchmarks of the single helpers. Each function receives the encoded image and returns a callable that
+    runs only the step to measure, so decoding is not included"""
+
+    def crop_transparency(data):
+        im = decode(data)
+        return lambda: image.crop_transparency(im)
+
+    def resize_keep_rateo(data):
+        im = decode(data)
+        return lambda: image.resize_keep_rateo(im, 512)
+
+    def resize_512(data):
+        im = decode(data)
+        size = image.get_correct_size(im.size, max_size=512)
+        return lambda: image.resize(im, size)
+
+    def get_correct_size(data):
+        im = decode(data)
+        return lambda: image.get_correct_size(im.size, max_size=512)
+
+    return dict(
+        crop_transparency=crop_transparency,
+        resize_keep_rateo=resize_keep_rateo,
+        resize_512=resize_512,
+        get_correct_size=get_correct_size,
+    )
+
+
+def disable_malloc_buffer_reuse():
+    """by default glibc keeps freed large buffers in the heap and reuses them, so after the first run the peak RSS
+    wouldn't grow anymore. A fixed mmap threshold makes buffers larger than 128 kB be returned to the OS when freed"""
+
+    try:
+        libc = ctypes.CDLL("libc.so.6")
+    except OSError:
+        return
+
+    m_mmap_threshold = -3
+    libc.mallopt(m_mmap_threshold, 128 * 1024)
+
+
+def reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # resets the peak RSS (VmHWM) to the current RSS
+        return True
+    except OSError:
+        return False
+
+
+def read_rss_kb() -> tuple:
+    """returns (current RSS, peak RSS) in kB"""
+
+    try:
+        with open("/proc/self/status") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(status["VmRSS"].split()[0]), int(status["VmHWM"].split()[0])
+    except (OSError, KeyError):
+        # ru_maxrss is the peak of the whole process: it can't be reset
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            max_rss //= 1024  # bytes on macos
+        return max_rss, max_rss
+
+
+def measure(func, runs: int) -> dict:
+    func()  # warm up
+
+    reset_peak_rss()
+    rss_before, _ = read_rss_kb()
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    _, peak_rss = read_rss_kb()
+
+    timings_ms = np.array(timings) * 1000
+    return dict(
+        runs=runs,
+        throughput_per_s=round(runs / sum(timings), 2),
+        median_ms=round(float(np.median(timings_ms)), 3),
+        p95_ms=round(float(np.percentile(timings_ms, 95)), 3),
+        peak_memory_mb=round(max(peak_rss - rss_before, 0) / 1024, 2),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES), help="comma-separated list of sizes")
+    parser.add_argument("--only", help="run only the benchmarks whose name contains this string")
+    parser.add_argument("--output", default="image_pipeline.json")
+    args = parser.parse_args()
+
+    disable_malloc_buffer_reuse()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    corpus = generate_corpus(sizes)
+
+    # name -> (setup function, format of the images to run it on)
+    benchmarks = {}
+    for name, (options, input_format) in OPTIONS.items():
+        benchmarks[f"process.{name}"] = (lambda data, options=options: lambda: process_file(data, options), input_format)
+    for name, setup in helper_benchmarks().items():
+        benchmarks[f"helper.{name}"] = (setup, None)
+
+    results = []
+    print("{:<40} {:>6} {:>10} {:>10} {:>10}".format("benchmark", "size", "img/s", "p95 (ms)", "peak (MB)"))
+    for benchmark_name, (setup, input_format) in benchmarks.items():
+        if args.only and args.only not in benchmark_name:
+            continue
+
+        for size in sizes:
+            size_results = []
+            for item in corpus:
+                if item["size"] != size or (input_format and item["input_format"] != input_format):
+                    continue
+
+                try:
+                    result = measure(setup(item["data"]), args.runs)
+                except Exception as e:
+                    # keep going: the error is saved in the report
+                    print(f"{benchmark_name}: error with image {item['name']}: {e!r}")
+                    result = dict(error=repr(e))
+
+                result.update(
+                    benchmark=benchmark_name,
+                    image=item["name"],
+                    size=item["size"],
+                    shape=item["shape"],
+                    mode=item["mode"],
+                    input_format=item["input_format"],
+                    dimensions=item["dimensions"],
+                )
+                size_results.append(result)
+
+            results.extend(size_results)
+
+            # summary of all the images of this size
+            size_results = [r for r in size_results if "error" not in r]
+            if not size_results:
+                continue
+
+            total_time = sum(r["runs"] / r["throughput_per_s"] for r in size_results)
+            print("{:<40} {:>6} {:>10.1f} {:>10.2f} {:>10.1f}".format(
+                benchmark_name,
+                size,
+                sum(r["runs"] for r in size_results) / total_time,
+                max(r["p95_ms"] for r in size_results),
+                max(r["peak_memory_mb"] for r in size_results)
+            ))
+
+    report = dict(
+        python=platform.python_version(),
+        pillow=PIL.__version__,
+        numpy=np.__version__,
+        platform=platform.platform(),
+        runs=args.runs,
+        sizes=sizes,
+        results=results,
+    )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Measures how long it takes to get the emojis of the stickers of a set from a GetStickerSet response (see
+bot/utils/pyrogram.py): the emojis of a single sticker (adding a sticker to a pack) and the emojis dict of the whole
+set (/export).
+
+The responses are generated: sets of 120 stickers (the max size of static packs), whose stickers are bound to
+a total of 200 emojis.
+
+Usage (from the project root): python benchmarks/sticker_set_emojis.py [--runs N] [--stickers N] [--emojis N]"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import types
+
+from pyrogram.api import types as api_types
+from pyrogram.api.types import messages as api_messages
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+# register the packages without executing their __init__: importing the `bot` package would start the whole bot
+for package_name, package_path in (("bot", "bot"), ("bot.utils", os.path.join("bot", "utils"))):
+    package = types.ModuleType(package_name)
+    package.__path__ = [os.path.join(ROOT, package_path)]
+    sys.modules[package_name] = package
+
+from bot.utils import pyrogram  # noqa: E402
+
+EMOJIS = [chr(code_point) for code_point in range(0x1F600, 0x1F650)] + [chr(code_point) for code_point in range(0x1F300, 0x1F3F0)]
+
+
+def generate_sticker_set(stickers: int, emojis: int):
+    rng = random.Random(0)
+    input_sticker_set = api_types.InputStickerSetShortName(short_name="benchmark")
+
+    documents = []
+    for index in range(stickers):
+        documents.append(api_types.Document(
+            id=rng.getrandbits(62),
+            access_hash=rng.getrandbits(62),
+            file_reference=bytes(rng.getrandbits(8) for _ in range(29)),
+            date=1600000000,
+            mime_type="image/webp",
+            size=30000,
+            dc_id=2,
+            attributes=[
+                api_types.DocumentAttributeImageSize(w=512, h=512),
+                api_types.DocumentAttributeSticker(alt=EMOJIS[index % len(EMOJIS)], stickerset=input_sticker_set),
+                api_types.DocumentAttributeFilename(file_name="sticker.webp"),
+            ]
+        ))
+
+    # every sticker has at least an emoji, the other emojis are bound to random stickers
+    bound_documents = [[] for _ in range(emojis)]
+    for index, document in enumerate(documents):
+        bound_documents[index % emojis].append(document.id)
+    for index in range(stickers, emojis):
+        bound_documents[index].append(rng.choice(documents).id)
+
+    packs = [
+        api_types.StickerPack(emoticon=EMOJIS[index % len(EMOJIS)], documents=document_ids)
+        for index, document_ids in enumerate(bound_documents)
+    ]
+
+    sticker_set = api_types.StickerSet(
+        id=1,
+        access_hash=1,
+        title="benchmark",
+        short_name="benchmark",
+        count=stickers,
+        hash=1
+    )
+
+    return api_messages.StickerSet(set=sticker_set, packs=packs, documents=documents)
+
+
+def bench(func, runs: int) -> float:
+    func()  # warm up
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--stickers", type=int, default=120)
+    parser.add_argument("--emojis", type=int, default=200)
+    args = parser.parse_args()
+
+    sticker_set = generate_sticker_set(args.stickers, args.emojis)
+    document_id = sticker_set.documents[-1].id
+
+    def sticker_emojis():
+        # what get_emojis_from_pack() does when the set is not cached
+        return pyrogram.CachedStickerSet(sticker_set).emojis_by_document_id[document_id]
+
+    def set_emojis_dict():
+        # what get_set_emojis_dict() does when the set is not cached
+        return pyrogram.CachedStickerSet(sticker_set).emojis_dict
+
+    print("{} stickers, {} emojis".format(args.stickers, args.emojis))
+    print("{:<20} {:>10}".format("benchmark", "time (ms)"))
+    for name, func in (("sticker_emojis", sticker_emojis), ("set_emojis_dict", set_emojis_dict)):
+        print("{:<20} {:>10.3f}".format(name, bench(func, args.runs)))
+
+
+if __name__ == "__main__":
+    main()
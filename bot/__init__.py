@@ -9,19 +9,32 @@ from telegram.ext import ExtBot, Defaults
 from telegram.utils.request import Request
 
 from .utils import utils
+from .utils import imagepool
+from .utils import blobs
 from .utils.pyrogram import client
 from .database import base
 from .bot import StickersBot
+from . import jobs
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# every thread that makes Bot API requests needs its own connection, or urllib3 discards the connections exceeding the
+# pool size and opens a new one for each request: the dispatcher workers (+4 for the updater's own threads), the job
+# workers and, for each of them, the export threads that download the stickers and upload the volumes
+# (download_workers + 3, see export_job()), and the progress reporter
+CON_POOL_SIZE = (
+    config.telegram.get('workers', 1) + 4
+    + config.get('jobs', {}).get('workers', 2) * (1 + config.get('export', {}).get('download_workers', 4) + 3)
+    + 1
+)
+
 stickersbot = StickersBot(
     bot=ExtBot(
         token=config.telegram.token,
         defaults=Defaults(parse_mode=ParseMode.HTML, disable_web_page_preview=True),
         # https://github.com/python-telegram-bot/python-telegram-bot/blob/8531a7a40c322e3b06eb943325e819b37ee542e7/telegram/ext/updater.py#L267
-        request=Request(con_pool_size=config.telegram.get('workers', 1) + 4)
+        request=Request(con_pool_size=CON_POOL_SIZE)
     ),
     use_context=True,
     workers=config.telegram.get('workers', 1),
@@ -32,11 +45,20 @@ stickersbot = StickersBot(
 def main():
     utils.load_logging_config('logging.json')
 
+    # the image workers are forked: start them before any other thread is started
+    imagepool.pool.start()
+
+    blobs.cache.start()
+
     if config.pyrogram.enabled:
         logger.info('starting pyrogram client...')
         client.start()
 
     stickersbot.import_handlers(r'bot/handlers/')
+
+    # must be started after the handlers have been imported, because they register the job functions
+    jobs.queue.start(stickersbot.bot, workers=config.get('jobs', {}).get('workers', 2))
+
     stickersbot.run(drop_pending_updates=True, allowed_updates=[Update.MESSAGE, Update.CALLBACK_QUERY, Update.CHANNEL_POST])
 
 
@@ -24,6 +24,7 @@ class StickersBot(Updater):
         BotCommand('cleanup', 'remove from the database packs deleted from @stickers'),
         BotCommand('forgetme', 'delete yourself from the database'),
         BotCommand('export', 'export a pack to a zip file'),
+        BotCommand('jobs', 'see the status of your exports'),
         BotCommand('readd', 'save a pack created by the bot'),
         BotCommand('tofile', 'convert stickers and custom emojis to file'),
         BotCommand('toemoji', 'resize a stickers so it can be used as emoji'),
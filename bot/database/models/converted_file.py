@@ -0,0 +1,25 @@
+import datetime
+
+from sqlalchemy import Column, String, DateTime
+
+from ..base import Base, engine
+
+
+class ConvertedFile(Base):
+    __tablename__ = 'converted_files'
+
+    # file_unique_id of the sticker + the image.Options used to convert it (see image.Options.cache_key())
+    key = Column(String, primary_key=True)
+    file_unique_id = Column(String)
+    # file_id of the converted document we sent
+    file_id = Column(String)
+    last_used = Column(DateTime)
+
+    def __init__(self, key, file_unique_id, file_id):
+        self.key = key
+        self.file_unique_id = file_unique_id
+        self.file_id = file_id
+        self.last_used = datetime.datetime.utcnow()
+
+
+Base.metadata.create_all(engine)
@@ -0,0 +1,32 @@
+import datetime
+import json
+
+from sqlalchemy import Column, String, Integer, DateTime
+
+from ..base import Base, engine
+
+
+class ExportedArchive(Base):
+    __tablename__ = 'exported_archives'
+
+    # sha256 of the pack name + the ordered list of its stickers' file_unique_id and emoji (+ the pack's hash, see
+    # archive_cache_key())
+    key = Column(String, primary_key=True)
+    set_name = Column(String)
+    # json list of the file_id of the zip volumes
+    file_ids = Column(String)
+    file_size = Column(Integer)
+    last_used = Column(DateTime)
+
+    def __init__(self, key, set_name, file_ids: list, file_size=None):
+        self.key = key
+        self.set_name = set_name
+        self.file_ids = json.dumps(file_ids)
+        self.file_size = file_size
+        self.last_used = datetime.datetime.utcnow()
+
+    def get_file_ids(self) -> list:
+        return json.loads(self.file_ids)
+
+
+Base.metadata.create_all(engine)
@@ -0,0 +1,51 @@
+import datetime
+import json
+
+from sqlalchemy import Column, String, Integer, DateTime
+
+from ..base import Base, engine
+
+
+class JobStatus:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class Job(Base):
+    __tablename__ = 'jobs'
+
+    job_id = Column(Integer, primary_key=True)
+    job_type = Column(String)
+    user_id = Column(Integer)
+    chat_id = Column(Integer)
+    status = Column(String, default=JobStatus.QUEUED)
+    # json dict: the job's arguments
+    payload = Column(String)
+    # json dict: what has been done so far, to resume the job if the bot is restarted
+    checkpoint = Column(String)
+    progress_done = Column(Integer, default=0)
+    progress_total = Column(Integer, default=0)
+    error = Column(String)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+    def __init__(self, job_type, user_id, chat_id, payload: dict):
+        self.job_type = job_type
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.status = JobStatus.QUEUED
+        self.payload = json.dumps(payload)
+        self.checkpoint = json.dumps({})
+        self.created_at = datetime.datetime.utcnow()
+        self.updated_at = self.created_at
+
+    def get_payload(self) -> dict:
+        return json.loads(self.payload or '{}')
+
+    def get_checkpoint(self) -> dict:
+        return json.loads(self.checkpoint or '{}')
+
+
+Base.metadata.create_all(engine)
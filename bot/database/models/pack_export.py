@@ -0,0 +1,41 @@
+import datetime
+import json
+
+from sqlalchemy import Column, String, Integer, DateTime
+
+from ..base import Base, engine
+
+
+class PackExport(Base):
+    """The stickers of a pack a user received the last time they exported it, and the ones they didn't receive
+    because we failed to download them"""
+
+    __tablename__ = 'pack_exports'
+
+    export_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    set_name = Column(String)
+    # json list of the exported stickers' file_unique_id
+    file_unique_ids = Column(String)
+    # json list of the file_unique_id of the stickers we failed to download
+    failed_file_unique_ids = Column(String)
+    exported_at = Column(DateTime)
+
+    def __init__(self, user_id, set_name, file_unique_ids: list, failed_file_unique_ids: list):
+        self.user_id = user_id
+        self.set_name = set_name
+        self.set_file_unique_ids(file_unique_ids, failed_file_unique_ids)
+
+    def get_file_unique_ids(self) -> list:
+        return json.loads(self.file_unique_ids or '[]')
+
+    def get_failed_file_unique_ids(self) -> list:
+        return json.loads(self.failed_file_unique_ids or '[]')
+
+    def set_file_unique_ids(self, file_unique_ids: list, failed_file_unique_ids: list):
+        self.file_unique_ids = json.dumps(file_unique_ids)
+        self.failed_file_unique_ids = json.dumps(failed_file_unique_ids)
+        self.exported_at = datetime.datetime.utcnow()
+
+
+Base.metadata.create_all(engine)
@@ -0,0 +1,24 @@
+import datetime
+
+from sqlalchemy import Column, String, DateTime
+
+from ..base import Base, engine
+
+
+class UploadedSticker(Base):
+    __tablename__ = 'uploaded_stickers'
+
+    # file_unique_id of the png document sent by the user (webp documents are uploaded every time)
+    file_unique_id = Column(String, primary_key=True)
+    # file_id (returned by upload_sticker_file) of the file we uploaded for that document, resized/re-encoded if it
+    # needed to be: we can pass it to add_sticker_to_set/create_new_sticker_set
+    file_id = Column(String)
+    last_used = Column(DateTime)
+
+    def __init__(self, file_unique_id, file_id):
+        self.file_unique_id = file_unique_id
+        self.file_id = file_id
+        self.last_used = datetime.datetime.utcnow()
+
+
+Base.metadata.create_all(engine)
@@ -8,6 +8,7 @@ from telegram import ChatAction, Update
 from bot import stickersbot
 from bot.database.base import session_scope
 from bot.database.models.pack import Pack
+from bot.database.models.pack_export import PackExport
 from bot.strings import Strings
 from bot.utils import decorators
 
@@ -24,6 +25,8 @@ def on_forgetme_command(update: Update, _):
         deleted_rows = session.query(Pack).filter(Pack.user_id==update.effective_user.id).delete()
         logger.info('deleted rows: %d', deleted_rows or 0)
 
+        session.query(PackExport).filter(PackExport.user_id==update.effective_user.id).delete()
+
     update.message.reply_text(Strings.FORGETME_SUCCESS)
 
     return ConversationHandler.END  # /forgetme should end whatever conversation the user was having
@@ -0,0 +1,58 @@
+import logging
+
+# noinspection PyPackageRequirements
+from telegram.ext import CommandHandler
+# noinspection PyPackageRequirements
+from telegram import ChatAction, Update
+
+from bot import jobs
+from bot import stickersbot
+from bot.database.models.job import JobStatus
+from bot.strings import Strings
+from bot.utils import decorators
+from bot.utils import utils
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUS_DESC = {
+    JobStatus.QUEUED: "queued",
+    JobStatus.RUNNING: "in progress",
+    JobStatus.DONE: "completed",
+    JobStatus.FAILED: "failed"
+}
+
+
+def job_description(job: dict) -> str:
+    text = '#{} /{}'.format(job['job_id'], job['job_type'])
+
+    set_name = job['payload'].get('set_name', None)
+    if set_name:
+        text += ' <a href="{}">{}</a>'.format(utils.name2link(set_name), set_name)
+
+    text += ': {}'.format(JOB_STATUS_DESC.get(job['status'], job['status']))
+
+    if job['status'] in (JobStatus.RUNNING, JobStatus.FAILED) and job['progress_total']:
+        text += ' ({}/{})'.format(job['progress_done'], job['progress_total'])
+    if job['status'] == JobStatus.FAILED and job['error']:
+        text += ' <code>{}</code>'.format(utils.escape_html(job['error'][:100]))
+
+    return text
+
+
+@decorators.action(ChatAction.TYPING)
+@decorators.restricted
+@decorators.failwithmessage
+def on_jobs_command(update: Update, _):
+    logger.info('/jobs')
+
+    user_jobs = jobs.queue.user_jobs(update.effective_user.id)
+    if not user_jobs:
+        update.message.reply_text(Strings.JOBS_NO_JOBS)
+        return
+
+    jobs_list = [job_description(job) for job in user_jobs]
+
+    update.message.reply_html(Strings.JOBS_HEADER + '• {}'.format('\n• '.join(jobs_list)))
+
+
+stickersbot.add_handler(CommandHandler(['jobs', 'status'], on_jobs_command))
@@ -1,12 +1,14 @@
 import logging
 
 # noinspection PyPackageRequirements
-from telegram.ext import CommandHandler, CallbackContext, ConversationHandler
+from telegram.ext import CommandHandler, ConversationHandler
 # noinspection PyPackageRequirements
 from telegram import ChatAction, Update, TelegramError
 
+from bot import jobs
 from bot import stickersbot
 from bot.utils import decorators
+from bot.utils import progress
 from bot.utils import utils
 from bot.database.base import session_scope
 from bot.database.models.pack import Pack
@@ -18,26 +20,46 @@ logger = logging.getLogger(__name__)
 @decorators.action(ChatAction.TYPING)
 @decorators.restricted
 @decorators.failwithmessage
-def on_cleanup_command(update: Update, context: CallbackContext):
+def on_cleanup_command(update: Update, _):
     logger.info('/cleanup')
 
-    # packs = db.get_user_packs(update.effective_user.id, as_namedtuple=True)
     with session_scope() as session:
-        packs = session.query(Pack).filter_by(user_id=update.effective_user.id).all()
-        packs = [(p.title, p.name, p.type) for p in packs]
+        packs_count = session.query(Pack).filter_by(user_id=update.effective_user.id).count()
 
-    if not packs:
+    if not packs_count:
         update.message.reply_text(Strings.LIST_NO_PACKS)
         return
 
-    update.message.reply_html(Strings.CLEANUP_WAIT)
+    message_to_edit = update.message.reply_html(Strings.CLEANUP_WAIT)
+
+    payload = dict(message_id=update.message.message_id, progress_message_id=message_to_edit.message_id)
+    jobs.queue.enqueue('cleanup', update.effective_user.id, update.effective_chat.id, payload)
+
+    return ConversationHandler.END  # /cleanup should end whatever conversation the user was having
+
+
+@jobs.queue.register('cleanup')
+def cleanup_job(job: jobs.JobContext):
+    message_to_edit = job.message(job.payload['progress_message_id'])
+
+    # packs = db.get_user_packs(update.effective_user.id, as_namedtuple=True)
+    with session_scope() as session:
+        packs = session.query(Pack).filter_by(user_id=job.user_id).all()
+        packs = [(p.title, p.name, p.type) for p in packs]
+
+    # what we found before the job got interrupted
+    checked_packs = job.checkpoint.get('checked', [])
+    packs_to_delete = job.checkpoint.get('to_delete', [])
+
+    for i, pack in enumerate(packs):
+        if pack[1] in checked_packs:
+            continue
 
-    packs_to_delete = list()
-    for pack in packs:
         logger.debug('checking pack: %s', pack[1])
+        progress.reporter.report(message_to_edit, '{} (progress: {}/{})'.format(Strings.CLEANUP_WAIT, i, len(packs)))
 
         try:
-            context.bot.get_sticker_set(name=pack[1])
+            job.bot.get_sticker_set(name=pack[1])
         except TelegramError as telegram_error:
             if telegram_error.message == 'Stickerset_invalid':
                 logger.debug('this pack will be removed from the db (%s)', telegram_error.message)
@@ -45,22 +67,26 @@ def on_cleanup_command(update: Update, context: CallbackContext):
             else:
                 logger.debug('api exception: %s', telegram_error.message)
 
+        checked_packs.append(pack[1])
+        job.save_checkpoint(checked=checked_packs, to_delete=packs_to_delete)
+        job.save_progress(len(checked_packs), len(packs))
+
+    progress.reporter.done(message_to_edit, '{} (progress: {}/{})'.format(Strings.CLEANUP_WAIT, len(packs), len(packs)))
+
     if not packs_to_delete:
-        update.message.reply_text(Strings.CLEANUP_NO_PACK)
+        job.reply_html(Strings.CLEANUP_NO_PACK, reply_to_message_id=job.payload['message_id'])
         return
 
     with session_scope() as session:
         for _, pack_name, _ in packs_to_delete:
             logger.info('deleting pack from db...')
-            session.query(Pack).filter(Pack.user_id==update.effective_user.id, Pack.name==pack_name).delete()
+            session.query(Pack).filter(Pack.user_id==job.user_id, Pack.name==pack_name).delete()
 
         logger.info('done')
 
     packs_links = ['<a href="{}">{}</a>'.format(utils.name2link(pack[1]), pack[0]) for pack in packs_to_delete]
 
-    update.message.reply_html(Strings.CLEANUP_HEADER + '• {}'.format('\n• '.join(packs_links)))
-
-    return ConversationHandler.END  # /cleanup should end whatever conversation the user was having
+    job.reply_html(Strings.CLEANUP_HEADER + '• {}'.format('\n• '.join(packs_links)), reply_to_message_id=job.payload['message_id'])
 
 
-stickersbot.add_handler(CommandHandler(['cleanup', 'cu'], on_cleanup_command, run_async=True))
+stickersbot.add_handler(CommandHandler(['cleanup', 'cu'], on_cleanup_command))
@@ -3,13 +3,15 @@ import logging
 # noinspection PyPackageRequirements
 from telegram import ChatAction, Update, TelegramError
 # noinspection PyPackageRequirements
-from telegram.ext import CommandHandler, CallbackContext
+from telegram.ext import CommandHandler
 
+from bot import jobs
 from bot import stickersbot
 from bot.database.base import session_scope
 from bot.database.models.pack import Pack
 from bot.strings import Strings
 from bot.utils import decorators
+from bot.utils import progress
 from bot.utils import utils
 
 logger = logging.getLogger(__name__)
@@ -18,37 +20,59 @@ logger = logging.getLogger(__name__)
 @decorators.action(ChatAction.TYPING)
 @decorators.restricted
 @decorators.failwithmessage
-def on_count_command(update: Update, context: CallbackContext):
+def on_count_command(update: Update, _):
     logger.info('/count')
 
     with session_scope() as session:
-        packs = session.query(Pack).filter_by(user_id=update.effective_user.id).order_by(Pack.title).all()
-        packs = [(p.title, p.name, p.is_animated) for p in packs]
+        packs_count = session.query(Pack).filter_by(user_id=update.effective_user.id).count()
 
-    if not packs:
+    if not packs_count:
         update.message.reply_text(Strings.LIST_NO_PACKS)
         return
 
-    update.message.reply_html("Hold on, this might take some time...")
+    message_to_edit = update.message.reply_html(Strings.COUNT_WAIT)
+
+    payload = dict(message_id=update.message.message_id, progress_message_id=message_to_edit.message_id)
+    jobs.queue.enqueue('count', update.effective_user.id, update.effective_chat.id, payload)
+
+
+@jobs.queue.register('count')
+def count_job(job: jobs.JobContext):
+    message_to_edit = job.message(job.payload['progress_message_id'])
+
+    with session_scope() as session:
+        packs = session.query(Pack).filter_by(user_id=job.user_id).order_by(Pack.title).all()
+        packs = [(p.title, p.name, p.is_animated) for p in packs]
+
+    # results of the packs we checked before the job got interrupted
+    results_list = job.checkpoint.get('results', [])
+    checked_packs = {p['name'] for p in results_list}
+
+    for i, pack in enumerate(packs):
+        if pack[1] in checked_packs:
+            continue
 
-    results_list = []
-    for pack in packs:
         logger.debug('checking pack: %s', pack[1])
+        progress.reporter.report(message_to_edit, '{} (progress: {}/{})'.format(Strings.COUNT_WAIT, i, len(packs)))
 
         pack_result_dict = dict(title=pack[0], name=pack[1], result=None)
 
         try:
-            sticker_set = context.bot.get_sticker_set(name=pack[1])
+            sticker_set = job.bot.get_sticker_set(name=pack[1])
             pack_result_dict['result'] = len(sticker_set.stickers)
         except TelegramError as telegram_error:
             logger.debug('api exception: %s', telegram_error.message)
             pack_result_dict['result'] = telegram_error.message
 
         results_list.append(pack_result_dict)
+        job.save_checkpoint(results=results_list)
+        job.save_progress(len(results_list), len(packs))
+
+    progress.reporter.done(message_to_edit, '{} (progress: {}/{})'.format(Strings.COUNT_WAIT, len(packs), len(packs)))
 
     strings_list = ['<a href="{}">{}</a>: {}'.format(utils.name2link(p['name']), p['title'], p['result']) for p in results_list]
 
-    update.message.reply_html('• {}'.format('\n• '.join(strings_list)))
+    job.reply_html('• {}'.format('\n• '.join(strings_list)), reply_to_message_id=job.payload['message_id'])
 
 
-stickersbot.add_handler(CommandHandler(['count'], on_count_command, run_async=True))
+stickersbot.add_handler(CommandHandler(['count'], on_count_command))
@@ -17,11 +17,13 @@ from bot.strings import Strings
 from bot.database.base import session_scope
 from bot.database.models.pack import Pack
 from bot.markups import InlineKeyboard
-from bot.stickers import StickerFile
-from constants.stickers import StickerType as PackType, STICKER_TYPE_DESC
+from bot.stickers import StickerFile, send_sticker_request
+from constants.stickers import StickerType as PackType, STICKER_TYPE_DESC, MAX_STATIC_STICKER_FILE_SIZE
 import bot.stickers.error as error
 from ..conversation_statuses import Status
 from ...utils import decorators
+from ...utils import image
+from ...utils import imagepool
 from ...utils import utils
 
 logger = logging.getLogger(__name__)
@@ -155,11 +157,6 @@ def on_first_sticker_receive(update: Update, context: CallbackContext):
 
     context.user_data['pack'].pop('emojis', None)  # make sure to pop emojis
 
-    sticker_file.download()
-
-    if sticker_file.is_static_sticker() and sticker_file.is_document():
-        sticker_file.add_to_pack_prepare_sticker_document()  # will properly resize static stickers
-
     try:
         logger.debug('executing API request...')
         request_payload = {
@@ -167,11 +164,10 @@ def on_first_sticker_receive(update: Update, context: CallbackContext):
             "title": title,
             "name": full_name,
             "emojis": sticker_file.get_emojis_str(),
-            "sticker_type": Sticker.REGULAR,
-            sticker_file.api_arg_name: sticker_file.get_input_file()
+            "sticker_type": Sticker.REGULAR
         }
-
-        context.bot.create_new_sticker_set(**request_payload)
+        # the sticker file is added by send_sticker_request()
+        send_sticker_request(context.bot, context.bot.create_new_sticker_set, request_payload, sticker_file)
     except (error.PackInvalid, error.NameInvalid, error.NameAlreadyOccupied) as e:
         logger.error('Telegram error while creating stickers pack: %s', e.message)
         if isinstance(e, error.NameAlreadyOccupied):
@@ -184,6 +180,29 @@ def on_first_sticker_receive(update: Update, context: CallbackContext):
         sticker_file.close()
 
         return Status.CREATE_WAITING_NAME  # do not continue, wait for another name
+    except error.FileTooBig as e:
+        logger.error('sticker file too big: %s', e.message)
+        update.message.reply_html(Strings.ADD_STICKER_FILE_TOO_BIG.format(MAX_STATIC_STICKER_FILE_SIZE // 1024), quote=True)
+        sticker_file.close()
+
+        return Status.CREATE_WAITING_FIRST_STICKER
+    except imagepool.ImagePoolFull:
+        update.message.reply_text(Strings.IMAGE_POOL_FULL, quote=True)
+        sticker_file.close()
+
+        return Status.CREATE_WAITING_FIRST_STICKER
+    except image.ImageTooLarge as e:
+        logger.info('image too large: %s', str(e))
+        update.message.reply_text(Strings.ADD_STICKER_IMAGE_TOO_LARGE, quote=True)
+        sticker_file.close()
+
+        return Status.CREATE_WAITING_FIRST_STICKER
+    except image.InvalidImage as e:
+        logger.info('invalid image: %s', str(e))
+        update.message.reply_text(Strings.ADD_STICKER_INVALID_IMAGE, quote=True)
+        sticker_file.close()
+
+        return Status.CREATE_WAITING_FIRST_STICKER
     except error.InvalidAnimatedSticker as e:
         logger.error('Telegram error while creating animated pack: %s', e.message)
         update.message.reply_html(Strings.ADD_STICKER_INVALID_ANIMATED, quote=True)
@@ -1,14 +1,19 @@
+import datetime
+import hashlib
 import json
 import logging
-import tempfile
-import time
+import shutil
 import zipfile
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from html import escape as html_escape
+from typing import Optional, List, Tuple
 
 # noinspection PyPackageRequirements
-from telegram import ChatAction, ParseMode, Update
+from telegram import ChatAction, ParseMode, Update, StickerSet
 # noinspection PyPackageRequirements
-from telegram.error import BadRequest, TelegramError
+from telegram.error import BadRequest
 # noinspection PyPackageRequirements
 from telegram.ext import (
     CommandHandler,
@@ -18,18 +23,31 @@ from telegram.ext import (
     Filters
 )
 
+from bot import jobs
 from bot import stickersbot
+from bot.database.base import session_scope
+from bot.database.models.exported_archive import ExportedArchive
+from bot.database.models.pack_export import PackExport
 from bot.stickers import StickerFile
 from bot.strings import Strings
 from config import config
 from ..conversation_statuses import Status
 from ..fallback_commands import cancel_command
 from ...utils import decorators
+from ...utils import progress
+from ...utils import upload
 from ...utils import utils
-from ...utils.pyrogram import get_set_emojis_dict
+from ...utils.pyrogram import get_set_emojis_dict, get_set_hash
 
 logger = logging.getLogger(__name__)
 
+# size we assume when the Bot API doesn't tell us a sticker's size (max size of static stickers)
+MAX_STICKER_FILE_SIZE = 512 * 1024
+# local header + data descriptor + central directory header (and two copies of the file name, ~30 bytes)
+ZIP_ENTRY_OVERHEAD = 200
+# room for the end of central directory record and emojis.json
+ZIP_RESERVED_BYTES = 256 * 1024
+
 
 class DummyMessage:
     def __init__(self, sticker):
@@ -37,19 +55,165 @@ class DummyMessage:
         self.document = None
 
 
+def download_sticker(sticker) -> StickerFile:
+    # noinspection PyTypeChecker
+    sticker_file = StickerFile(
+        DummyMessage(sticker),  # we do not have a Message but we need it,
+        emojis=[sticker.emoji]  # we need to pass them explicitly so we avoid the Pyrogram request
+    )
+
+    try:
+        sticker_file.download()
+    except Exception:
+        sticker_file.close()
+        raise
+
+    return sticker_file
+
+
+def download_stickers(executor: ThreadPoolExecutor, stickers, window: int):
+    """Downloads the stickers using the executor's threads, and yields (sticker, StickerFile) tuples in pack order.
+    The StickerFile is None if the download failed. No more than `window` downloads are submitted at the same
+    time, so we do not keep the whole pack in memory if the consumer is slower than the downloads"""
+
+    stickers_iter = iter(stickers)
+    pending = deque()
+
+    def submit_next():
+        sticker = next(stickers_iter, None)
+        if sticker is not None:
+            pending.append((sticker, executor.submit(download_sticker, sticker)))
+
+    for _ in range(window):
+        submit_next()
+
+    try:
+        while pending:
+            sticker, future = pending.popleft()
+            submit_next()
+
+            # noinspection PyBroadException
+            try:
+                sticker_file = future.result()
+            except Exception:
+                logger.info('error while downloading and converting a stickers we need to export', exc_info=True)
+                sticker_file = None
+
+            yield sticker, sticker_file
+    finally:
+        # the consumer might stop early: make sure we do not leave open tempfiles around
+        for _, future in pending:
+            if not future.cancel() and not future.exception():
+                future.result().close()
+
+
+def plan_volumes(stickers: list, max_volume_size: int) -> List[list]:
+    """Splits the stickers into groups whose zip file will not exceed `max_volume_size` bytes. Stickers are stored
+    without compression, so we can use their `file_size` to know the size of the zip before downloading them"""
+
+    volumes = [[]]
+    volume_size = ZIP_RESERVED_BYTES
+    for sticker in stickers:
+        sticker_size = (sticker.file_size or MAX_STICKER_FILE_SIZE) + ZIP_ENTRY_OVERHEAD
+        if volumes[-1] and volume_size + sticker_size > max_volume_size:
+            volumes.append([])
+            volume_size = ZIP_RESERVED_BYTES
+
+        volumes[-1].append(sticker)
+        volume_size += sticker_size
+
+    return volumes
+
+
+def archive_cache_key(sticker_set: StickerSet) -> Optional[str]:
+    # file_unique_id changes when a sticker is replaced, so the key changes if stickers are added, removed or reordered.
+    # The emojis are included because they are saved in emojis.json
+    key_items = [sticker_set.name] + ['{}:{}'.format(sticker.file_unique_id, sticker.emoji) for sticker in sticker_set.stickers]
+
+    if config.pyrogram.enabled:
+        # emojis.json contains all the emojis of each sticker, the Bot API only returns the first one: the set's hash
+        # changes when any of them is edited
+        try:
+            key_items.append(str(get_set_hash(sticker_set.name)))
+        except Exception as e:
+            logger.error('error while trying to get the pack hash with pyrogram: %s', str(e), exc_info=True)
+            return None
+
+    return hashlib.sha256('\n'.join(key_items).encode()).hexdigest()
+
+
+def get_cached_archive(key: str) -> Optional[list]:
+    """returns the file_ids of the zip volumes we sent the last time the pack has been exported,
+    if the pack didn't change"""
+
+    with session_scope() as session:
+        cached_archive: ExportedArchive = session.query(ExportedArchive).filter_by(key=key).first()
+        if not cached_archive:
+            return
+
+        cached_archive.last_used = datetime.datetime.utcnow()
+        return cached_archive.get_file_ids()
+
+
+def save_cached_archive(key: str, set_name: str, file_ids: list, file_size: Optional[int], max_entries: int):
+    with session_scope() as session:
+        session.merge(ExportedArchive(key, set_name, file_ids, file_size))
+        session.flush()
+
+        # least recently used entries exceeding the limit
+        keys_to_delete = [row.key for row in session.query(ExportedArchive.key).order_by(ExportedArchive.last_used.desc()).offset(max_entries)]
+        if keys_to_delete:
+            logger.debug('removing %d archives from the export cache', len(keys_to_delete))
+            session.query(ExportedArchive).filter(ExportedArchive.key.in_(keys_to_delete)).delete('fetch')
+
+
+def delete_cached_archive(key: str):
+    with session_scope() as session:
+        session.query(ExportedArchive).filter_by(key=key).delete()
+
+
+def get_exported_stickers(user_id: int, set_name: str) -> Optional[Tuple[set, set]]:
+    """returns the file_unique_id of the stickers the user received the last time they exported the pack, and of
+    the stickers they didn't receive because we failed to download them"""
+
+    with session_scope() as session:
+        pack_export: PackExport = session.query(PackExport).filter_by(user_id=user_id, set_name=set_name).first()
+        if not pack_export:
+            return
+
+        return set(pack_export.get_file_unique_ids()), set(pack_export.get_failed_file_unique_ids())
+
+
+def save_exported_stickers(user_id: int, set_name: str, file_unique_ids: list, failed_file_unique_ids: list):
+    with session_scope() as session:
+        pack_export: PackExport = session.query(PackExport).filter_by(user_id=user_id, set_name=set_name).first()
+        if pack_export:
+            pack_export.set_file_unique_ids(file_unique_ids, failed_file_unique_ids)
+        else:
+            session.add(PackExport(user_id, set_name, file_unique_ids, failed_file_unique_ids))
+
+
 @decorators.action(ChatAction.TYPING)
 @decorators.restricted
 @decorators.failwithmessage
 @decorators.logconversation
-def on_export_command(update: Update, _):
+def on_export_command(update: Update, context: CallbackContext):
     logger.info('/export')
 
+    options = {
+        "-new": ("export_new", "<code>export only the stickers added since your last export, and the ones I failed to export</code>")
+    }
+
+    enabled_options_description = utils.check_flags(options, context, pop_existing_flags=True)
+
     update.message.reply_text(Strings.EXPORT_PACK_SELECT)
+    if enabled_options_description:
+        update.message.reply_html(f"{Strings.ENABLED_FLAGS}{' + '.join(enabled_options_description)}")
 
     return Status.WAITING_STICKER
 
 
-@decorators.action(ChatAction.UPLOAD_DOCUMENT)
+@decorators.action(ChatAction.TYPING)
 @decorators.failwithmessage
 @decorators.logconversation
 def on_sticker_receive(update: Update, context: CallbackContext):
@@ -59,84 +223,275 @@ def on_sticker_receive(update: Update, context: CallbackContext):
         update.message.reply_text(Strings.EXPORT_PACK_NO_PACK)
         return Status.WAITING_STICKER
 
-    sticker_set = context.bot.get_sticker_set(update.message.sticker.set_name)
+    message_to_edit = update.message.reply_html(Strings.EXPORT_PACK_QUEUED, quote=True)
 
-    base_progress_message = Strings.EXPORT_PACK_START.format(html_escape(sticker_set.title))
-    message_to_edit = update.message.reply_html(base_progress_message, quote=True)
+    payload = dict(
+        set_name=update.message.sticker.set_name,
+        export_new=context.user_data.pop('export_new', False),
+        message_id=update.message.message_id,
+        progress_message_id=message_to_edit.message_id
+    )
+    jobs.queue.enqueue('export', update.effective_user.id, update.effective_chat.id, payload)
 
-    pack_emojis = dict()  # we need to create this dict just in case the pyrogram request fails
-
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        logger.info('using %s as TemporaryDirectory', tmp_dir)
+    return ConversationHandler.END
 
-        with tempfile.TemporaryFile() as tmp_file:  # temporary zip file
-            with zipfile.ZipFile(tmp_file, 'w') as zip_file:
 
-                total = len(sticker_set.stickers)
-                skipped_stickers = 0
-                for i, sticker in enumerate(sticker_set.stickers):
-                    # noinspection PyTypeChecker
-                    sticker_file = StickerFile(
-                        DummyMessage(sticker),  # we do not have a Message but we need it,
-                        emojis=[sticker.emoji],  # we need to pass them explicitly so we avoid the Pyrogram request
-                        tempfile_to_use=tempfile.NamedTemporaryFile(dir=tmp_dir)
+@jobs.queue.register('export')
+def export_job(job: jobs.JobContext):
+    user_id = job.user_id
+    reply_to_message_id = job.payload['message_id']
+    message_to_edit = job.message(job.payload['progress_message_id'])
+
+    sticker_set = job.bot.get_sticker_set(job.payload['set_name'])
+    caption = '<a href="{}">{}</a>'.format(utils.name2link(sticker_set.name), html_escape(sticker_set.title))
+
+    if not job.is_resumed():
+        # stickers the user already has from a previous export: only used when exporting new stickers
+        already_exported = set()
+        # stickers we failed to download the last time: they are exported again, but they are not new
+        previously_failed = set()
+        if job.payload.get('export_new', False):
+            last_export = get_exported_stickers(user_id, sticker_set.name)
+            if last_export is None:
+                job.reply_html(Strings.EXPORT_NEW_NEVER_EXPORTED)
+            else:
+                already_exported, previously_failed = last_export
+
+        stickers_to_export = [s for s in sticker_set.stickers if s.file_unique_id not in already_exported]
+        if not stickers_to_export:
+            job.reply_html(Strings.EXPORT_NEW_NOTHING_NEW, reply_to_message_id=reply_to_message_id)
+            return
+
+        full_export = len(stickers_to_export) == len(sticker_set.stickers)
+
+        # only full exports are cached
+        cache_max_entries = config.get('export', {}).get('cache_max_entries', 500) if full_export else 0
+        cache_key = archive_cache_key(sticker_set) if cache_max_entries else None
+        cached_file_ids = get_cached_archive(cache_key) if cache_key else None
+        if cached_file_ids:
+            logger.info('the pack did not change since the last export, sending the cached archive')
+            try:
+                for i, file_id in enumerate(cached_file_ids):
+                    volume_caption = caption
+                    if len(cached_file_ids) > 1:
+                        volume_caption += Strings.EXPORT_VOLUME.format(i + 1, len(cached_file_ids))
+
+                    job.bot.send_document(
+                        job.chat_id,
+                        file_id,
+                        caption=volume_caption,
+                        parse_mode=ParseMode.HTML,
+                        reply_to_message_id=reply_to_message_id,
+                        allow_sending_without_reply=True
                     )
+                save_exported_stickers(user_id, sticker_set.name, [s.file_unique_id for s in sticker_set.stickers], [])
+                return
+            except BadRequest as e:
+                logger.warning('cached archive cannot be sent (%s): exporting the pack again', e.message)
+                delete_cached_archive(cache_key)
+
+        volume_max_size = config.get('export', {}).get('volume_max_mb', 45) * 1024 * 1024
+        volumes = plan_volumes(stickers_to_export, volume_max_size)
+
+        # from now on, everything we need to resume the export is in the checkpoint
+        job.save_checkpoint(
+            volumes=[[s.file_unique_id for s in volume] for volume in volumes],
+            already_exported=list(already_exported),
+            previously_failed=[s.file_unique_id for s in stickers_to_export if s.file_unique_id in previously_failed],
+            full_export=full_export,
+            cache_key=cache_key,  # computed before exporting: the pack might change while we export it
+            sent_file_ids=[],  # file_id of the volumes that have been uploaded
+            sent_file_size=0,
+            exported=[],  # stickers included in the volumes that have been uploaded
+            skipped=0  # stickers we failed to download, in the volumes that have been uploaded
+        )
+    else:
+        logger.info('resuming export from volume %d', len(job.checkpoint['sent_file_ids']) + 1)
+
+    stickers_by_id = {s.file_unique_id: s for s in sticker_set.stickers}
+    volumes = job.checkpoint['volumes']
+    already_exported = set(job.checkpoint['already_exported'])
+    full_export = job.checkpoint['full_export']
+    first_volume_index = len(job.checkpoint['sent_file_ids'])
+
+    logger.info('exporting %d stickers in %d volumes', sum(len(v) for v in volumes), len(volumes))
+
+    if not full_export:
+        retried_count = len(job.checkpoint.get('previously_failed', []))
+        new_count = sum(len(v) for v in volumes) - retried_count
+        if new_count:
+            caption += Strings.EXPORT_NEW_STICKERS_COUNT.format(new_count)
+        if retried_count:
+            caption += Strings.EXPORT_NEW_PREVIOUSLY_FAILED_COUNT.format(retried_count)
 
-                    # noinspection PyBroadException
-                    try:
-                        sticker_file.download()
-                        pack_emojis[sticker.file_id] = sticker_file.emojis
-                    except Exception:
-                        logger.info('error while downloading and converting a stickers we need to export', exc_info=True)
-                        sticker_file.close()
-                        skipped_stickers += 1
-                        continue
-
-                    # https://stackoverflow.com/a/54202259
-                    zip_file.writestr(f'{sticker_file.file_unique_id}.{sticker_file.get_extension()}', sticker_file.sticker_tempfile.read())
-                    sticker_file.close()
-
-                    # edit message every 10 exported stickers, or when we're done
-                    progress = i + 1
-                    if progress == total or progress % 10 == 0:
-                        try:
-                            message_to_edit.edit_text(
-                                '{} (progress: {}/{})'.format(base_progress_message, progress, total),
-                                parse_mode=ParseMode.HTML
-                            )
-                            time.sleep(1)  # we do not want to get rate-limited
-                        except (TelegramError, BadRequest) as e:
-                            logger.warning('error while editing progress message: %s', e.message)
-
-                stickers_emojis_dict = pack_emojis
-                if config.pyrogram.enabled:
-                    try:
-                        stickers_emojis_dict = get_set_emojis_dict(update.message.sticker.set_name)
-                    except Exception as e:
-                        logger.error('error while trying to get the pack emojis with pyrogram: %s', str(e), exc_info=True)
-
-                with tempfile.SpooledTemporaryFile() as tmp_json:
-                    tmp_json.write(json.dumps(stickers_emojis_dict, indent=2).encode())
-                    tmp_json.seek(0)
-                    zip_file.writestr('emojis.json', tmp_json.read())
-
-                message_to_edit.reply_text(Strings.EXPORT_PACK_UPLOADING, quote=True)
-
-            tmp_file.seek(0)
-
-            update.message.reply_document(
-                tmp_file,
-                filename='{}.zip'.format(sticker_set.name),
-                caption='<a href="{}">{}</a>{}'.format(
-                    utils.name2link(sticker_set.name),
-                    html_escape(sticker_set.title),
-                    Strings.EXPORT_SKIPPED_STICKERS.format(skipped_stickers) if skipped_stickers != 0 else ""
-                ),
+    base_progress_message = Strings.EXPORT_PACK_START.format(html_escape(sticker_set.title))
+    download_workers = config.get('export', {}).get('download_workers', 4)
+    base_file_name = sticker_set.name if full_export else sticker_set.name + '_new'
+
+    # stickers removed from the pack after the export started: we can't download them anymore
+    missing_stickers = sum(1 for v in volumes[first_volume_index:] for unique_id in v if unique_id not in stickers_by_id)
+    stickers_to_export = [stickers_by_id[unique_id] for v in volumes[first_volume_index:] for unique_id in v if unique_id in stickers_by_id]
+
+    total = sum(len(v) for v in volumes)
+    processed = sum(len(v) for v in volumes[:first_volume_index])
+    skipped_stickers = job.checkpoint['skipped'] + missing_stickers
+    exported_now = set(job.checkpoint['exported'])
+
+    def finish_export():
+        # called once every volume has been sent
+        exported_stickers = [s.file_unique_id for s in sticker_set.stickers if s.file_unique_id in exported_now or s.file_unique_id in already_exported]
+        # stickers of the volumes we failed to download: the next "-new" export will not count them as new stickers
+        volumes_stickers = {unique_id for v in volumes for unique_id in v}
+        failed_stickers = [s.file_unique_id for s in sticker_set.stickers if s.file_unique_id in volumes_stickers and s.file_unique_id not in exported_now]
+        save_exported_stickers(user_id, sticker_set.name, exported_stickers, failed_stickers)
+
+        cache_max_entries = config.get('export', {}).get('cache_max_entries', 500)
+        cache_key = job.checkpoint.get('cache_key')
+        if full_export and cache_max_entries and cache_key and not skipped_stickers:
+            # do not cache incomplete archives
+            save_cached_archive(
+                cache_key,
+                sticker_set.name,
+                job.checkpoint['sent_file_ids'],
+                job.checkpoint['sent_file_size'],
+                cache_max_entries
+            )
+
+    if first_volume_index == len(volumes):
+        # the job has been interrupted after the last volume had been sent: there is nothing left to upload
+        logger.info('all the volumes have already been sent')
+        progress.reporter.done(message_to_edit)
+        finish_export()
+        return
+
+    def start_volume_upload(volume_index: int):
+        is_last_volume = volume_index == len(volumes) - 1
+        file_name = base_file_name
+        volume_caption = caption
+        if len(volumes) > 1:
+            file_name += '_{}of{}'.format(volume_index + 1, len(volumes))
+            volume_caption += Strings.EXPORT_VOLUME.format(volume_index + 1, len(volumes))
+
+        def upload_fields():
+            # called by the uploader once the zip has been streamed, so we know how many stickers have been skipped
+            return dict(
+                caption=volume_caption + (Strings.EXPORT_SKIPPED_STICKERS.format(skipped_stickers) if is_last_volume and skipped_stickers != 0 else ""),
                 parse_mode=ParseMode.HTML,
-                quote=True
+                reply_to_message_id=reply_to_message_id,
+                allow_sending_without_reply=True
             )
 
-    return ConversationHandler.END
+        volume_stream = upload.StreamPipe()
+        volume_upload_future = executor.submit(
+            upload.send_document_stream,
+            job.bot,
+            job.chat_id,
+            volume_stream,
+            filename='{}.zip'.format(file_name),
+            fields=upload_fields
+        )
+
+        return volume_stream, volume_upload_future
+
+    def save_volume_checkpoint(volume_upload):
+        # a volume's stickers are exported only once the volume has been uploaded. A volume is streamed to Telegram
+        # in a single request, so an interrupted volume can't be resumed: it is exported again from its first
+        # sticker (its stickers are usually still in the blob cache, so they are not downloaded again)
+        upload_future, volume_exported, volume_skipped = volume_upload
+        sent_message = upload_future.result()
+
+        job.save_checkpoint(
+            sent_file_ids=job.checkpoint['sent_file_ids'] + [sent_message.document.file_id],
+            sent_file_size=job.checkpoint['sent_file_size'] + (sent_message.document.file_size or 0),
+            exported=job.checkpoint['exported'] + volume_exported,
+            skipped=job.checkpoint['skipped'] + volume_skipped
+        )
+
+    # an upload must never wait for a free thread, or the zip writer would fill the pipe and block. Threads:
+    # - download_workers + 1 for the downloads: download_stickers() refills its window before waiting for the oldest
+    #   download, which can still be running
+    # - one for the pyrogram request, which runs while we download the stickers
+    # - two for the uploads: the volume we are streaming, and the previous one, which can still be waiting for
+    #   Telegram's response
+    with ThreadPoolExecutor(max_workers=download_workers + 4, thread_name_prefix='export') as executor:
+        emojis_future = None
+        if config.pyrogram.enabled:
+            emojis_future = executor.submit(get_set_emojis_dict, sticker_set.name)
+
+        downloads = download_stickers(executor, stickers_to_export, window=download_workers)
+        uploads = deque()
+
+        try:
+            for volume_index in range(first_volume_index, len(volumes)):
+                # keep at most one pending upload, so no more than two uploads run at the same time once we start
+                # streaming this volume
+                while len(uploads) > 1 or (uploads and uploads[0][0].done()):
+                    save_volume_checkpoint(uploads.popleft())
+
+                zip_stream, upload_future = start_volume_upload(volume_index)
+                volume_exported = []
+                volume_skipped = 0
+                volume_size = sum(1 for unique_id in volumes[volume_index] if unique_id in stickers_by_id)
+
+                try:
+                    with zipfile.ZipFile(zip_stream, 'w') as zip_file:
+                        for sticker, sticker_file in itertools.islice(downloads, volume_size):
+                            processed += 1
+                            progress.reporter.report(message_to_edit, '{} (progress: {}/{})'.format(base_progress_message, processed, total))
+                            job.save_progress(processed, total)
+
+                            if not sticker_file:
+                                skipped_stickers += 1
+                                volume_skipped += 1
+                                continue
+
+                            exported_now.add(sticker.file_unique_id)
+                            volume_exported.append(sticker.file_unique_id)
+
+                            with zip_file.open(sticker_file.file_name(), 'w') as zip_entry:
+                                shutil.copyfileobj(sticker_file.sticker_tempfile_seek(), zip_entry)
+                            sticker_file.close()
+
+                        if volume_index == len(volumes) - 1:
+                            # used just in case the pyrogram request fails. The manifest lists all the stickers
+                            # the user has, including the ones received with previous exports
+                            stickers_emojis_dict = {
+                                s.file_id: [s.emoji] for s in sticker_set.stickers
+                                if s.file_unique_id in exported_now or s.file_unique_id in already_exported
+                            }
+                            if emojis_future:
+                                try:
+                                    stickers_emojis_dict = emojis_future.result()
+                                except Exception as e:
+                                    logger.error('error while trying to get the pack emojis with pyrogram: %s', str(e), exc_info=True)
+
+                            zip_file.writestr('emojis.json', json.dumps(stickers_emojis_dict, indent=2))
+
+                    zip_stream.close()
+                except BrokenPipeError:
+                    # the upload failed while we were still writing the zip: raise the upload's exception instead
+                    upload_future.result()
+                    raise
+                except BaseException:
+                    # do not leave the upload thread waiting for data that will never come
+                    zip_stream.abort()
+                    raise
+
+                uploads.append((upload_future, volume_exported, volume_skipped))
+        except BaseException:
+            # keep track of the volumes that have been uploaded anyway, so they will not be sent again
+            # when the job is resumed
+            while uploads and not uploads[0][0].exception():
+                save_volume_checkpoint(uploads.popleft())
+            raise
+
+        progress.reporter.done(message_to_edit)
+        message_to_edit.reply_text(Strings.EXPORT_PACK_UPLOADING, quote=True)
+
+        while uploads:
+            save_volume_checkpoint(uploads.popleft())
+
+    finish_export()
 
 
 @decorators.action(ChatAction.TYPING)
@@ -150,28 +505,15 @@ def on_animated_sticker_receive(update: Update, _):
     return Status.WAITING_STICKER
 
 
-@decorators.action(ChatAction.TYPING)
-@decorators.failwithmessage
-@decorators.logconversation
-def on_ongoing_async_operation(update: Update, _):
-    logger.info('user sent a message while the export is ongoing')
-
-    update.message.reply_text(Strings.EXPORT_ONGOING)
-
-    # end the conversations maybe?
-    # return ConversationHandler.END  # end the conversations maybe?
-
-
 stickersbot.add_handler(ConversationHandler(
     name='export_command',
     persistent=False,
     entry_points=[CommandHandler(['export', 'e', 'dump'], on_export_command)],
     states={
         Status.WAITING_STICKER: [
-            MessageHandler(Filters.sticker, on_sticker_receive, run_async=True),
+            MessageHandler(Filters.sticker, on_sticker_receive),
         ],
         # ConversationHandler.TIMEOUT: [MessageHandler(Filters.all, on_timeout)]
-        ConversationHandler.WAITING: [MessageHandler(Filters.all, on_ongoing_async_operation)]
     },
     fallbacks=[CommandHandler(['cancel', 'c', 'done', 'd'], cancel_command)],
     # conversation_timeout=15 * 60
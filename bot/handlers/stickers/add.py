@@ -14,11 +14,13 @@ import bot.stickers.error as error
 from bot.database.base import session_scope
 from bot.database.models.pack import Pack
 from bot.markups import Keyboard
-from bot.stickers import StickerFile, send_request
+from bot.stickers import StickerFile, send_sticker_request
 from bot.strings import Strings
-from constants.stickers import StickerType, STICKER_TYPE_DESC, MAX_PACK_SIZE
+from constants.stickers import StickerType, STICKER_TYPE_DESC, MAX_PACK_SIZE, MAX_STATIC_STICKER_FILE_SIZE
 from ..conversation_statuses import Status
 from ...utils import decorators
+from ...utils import image
+from ...utils import imagepool
 from ...utils import utils
 
 logger = logging.getLogger(__name__)
@@ -155,10 +157,6 @@ def add_sticker_to_set(update: Update, context: CallbackContext):
 
     user_emojis = context.user_data['pack'].pop('emojis', None)  # we also remove them
     sticker_file = StickerFile(update.message, emojis=user_emojis)
-    sticker_file.download()
-
-    if sticker_file.is_static_sticker() and sticker_file.is_document():
-        sticker_file.add_to_pack_prepare_sticker_document()  # will properly resize static stickers
 
     pack_link = utils.name2link(pack_name)
 
@@ -170,10 +168,10 @@ def add_sticker_to_set(update: Update, context: CallbackContext):
             "user_id": update.effective_user.id,
             "name": pack_name,
             "emojis": sticker_file.get_emojis_str(),
-            sticker_file.api_arg_name: sticker_file.get_input_file(),
             "mask_position": None
         }
-        send_request(context.bot.add_sticker_to_set, request_payload)
+        # the sticker file is added by send_sticker_request()
+        send_sticker_request(context.bot, context.bot.add_sticker_to_set, request_payload, sticker_file)
     except error.PackFull:
         max_pack_size = MAX_PACK_SIZE.get(sticker_file.type, 0)
         update.message.reply_html(Strings.ADD_STICKER_PACK_FULL.format(pack_link, max_pack_size), quote=True)
@@ -182,6 +180,16 @@ def add_sticker_to_set(update: Update, context: CallbackContext):
     except error.FileDimensionInvalid:
         logger.error('resized stickers has the wrong size: %s', str(sticker_file))
         update.message.reply_html(Strings.ADD_STICKER_SIZE_ERROR, quote=True)
+    except error.FileTooBig:
+        update.message.reply_html(Strings.ADD_STICKER_FILE_TOO_BIG.format(MAX_STATIC_STICKER_FILE_SIZE // 1024), quote=True)
+    except imagepool.ImagePoolFull:
+        update.message.reply_text(Strings.IMAGE_POOL_FULL, quote=True)
+    except image.ImageTooLarge as e:
+        logger.info('image too large: %s', str(e))
+        update.message.reply_text(Strings.ADD_STICKER_IMAGE_TOO_LARGE, quote=True)
+    except image.InvalidImage as e:
+        logger.info('invalid image: %s', str(e))
+        update.message.reply_text(Strings.ADD_STICKER_INVALID_IMAGE, quote=True)
     except error.InvalidAnimatedSticker:
         update.message.reply_html(Strings.ADD_STICKER_INVALID_ANIMATED, quote=True)
     except error.PackInvalid:
@@ -12,13 +12,14 @@ from telegram.ext import (
 )
 
 from bot import stickersbot
-from bot.stickers import StickerFile
+from bot.stickers import StickerFile, reply_cached_conversion, save_conversion
 from bot.strings import Strings
 from ..conversation_statuses import Status
 from ..fallback_commands import cancel_command, on_timeout
 from ...customfilters import CustomFilters
 from ...utils import decorators
 from ...utils import image
+from ...utils import imagepool
 from ...utils import utils
 
 # noinspection PyPackageRequirements
@@ -55,21 +56,37 @@ def on_sticker_received(update: Update, context: CallbackContext):
     logger.info('/toemoji: sticker received')
 
     sticker_file = StickerFile(message=update.message)
-    sticker_file.download()
 
-    im = image.File(sticker_file.sticker_tempfile, image.Options(max_size=100, square=True))
-    im.options.crop_transparent_areas = "crop" in context.user_data
-    im.options.keep_aspect_rateo = not ("ignore_rateo" in context.user_data)
-    im.process()
+    options = image.Options(
+        max_size=100,
+        square=True,
+        crop_transparent_areas="crop" in context.user_data,
+        keep_aspect_rateo=not ("ignore_rateo" in context.user_data),
+        encoder_profile="small"  # the user will upload it to @Stickers, 100x100 images are encoded quickly anyway
+    )
+
+    if reply_cached_conversion(update.message, sticker_file, options, caption=sticker_file.get_emojis_str()):
+        return Status.WAITING_STICKER
 
-    update.message.reply_document(
-        im.result_tempfile,
+    sticker_file.download()
+    try:
+        emoji_tempfile = imagepool.pool.process(sticker_file.sticker_tempfile, options)
+    except imagepool.ImagePoolFull:
+        update.message.reply_text(Strings.IMAGE_POOL_FULL, quote=True)
+        return Status.WAITING_STICKER
+    finally:
+        sticker_file.close()
+
+    sent_message = update.message.reply_document(
+        emoji_tempfile,
         filename=f"{sticker_file.file_name()}",
         caption=sticker_file.get_emojis_str(),
         disable_content_type_detection=True
     )
 
-    im.close()
+    emoji_tempfile.close()
+
+    save_conversion(sent_message, sticker_file, options)
 
     return Status.WAITING_STICKER
 
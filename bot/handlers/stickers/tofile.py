@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 # noinspection PyPackageRequirements
 from telegram import ChatAction, Update, Message, ParseMode, MessageEntity, InputFile, Chat
@@ -11,13 +12,14 @@ from telegram.ext import (
 )
 
 from bot import stickersbot
-from bot.stickers import StickerFile
+from bot.stickers import StickerFile, reply_cached_conversion, save_conversion
 from bot.strings import Strings
 from ..conversation_statuses import Status
 from ..fallback_commands import cancel_command, on_timeout
 from ...customfilters import CustomFilters
 from ...utils import decorators
 from ...utils import image
+from ...utils import imagepool
 from ...utils import utils
 
 # noinspection PyPackageRequirements
@@ -46,13 +48,7 @@ def on_tofile_command(update: Update, context: CallbackContext):
     return Status.WAITING_STICKER
 
 
-@decorators.restricted
-@decorators.action(ChatAction.UPLOAD_DOCUMENT)
-@decorators.failwithmessage
-def on_sticker_received(update: Update, context: CallbackContext):
-    logger.info('user sent a sticker to convert')
-
-    sticker_file = StickerFile(update.message)
+def send_sticker_file(update: Update, sticker_file: StickerFile, static_sticker_as_png: bool, png_options: image.Options) -> Optional[Message]:
     sticker_file.download()
 
     request_kwargs = dict(
@@ -62,17 +58,18 @@ def on_sticker_received(update: Update, context: CallbackContext):
         quote=True
     )
 
-    static_sticker_as_png = "png" in context.user_data
-
     if update.message.sticker.is_animated:
         request_kwargs['filename'] = f"{update.message.sticker.file_unique_id}.tgs"
     elif update.message.sticker.is_video:
         request_kwargs['filename'] = f"{update.message.sticker.file_unique_id}.webm"
     elif static_sticker_as_png:
         logger.debug("converting webp to png")
-        im = image.File(sticker_file.sticker_tempfile, image.Options(image_format="png"))
-        im.process()
-        png_file = im.clone_result_tempfile(then_close=True)
+        try:
+            png_file = imagepool.pool.process(sticker_file.sticker_tempfile, png_options)
+        except imagepool.ImagePoolFull:
+            sticker_file.close()
+            update.message.reply_text(Strings.IMAGE_POOL_FULL, quote=True)
+            return
 
         request_kwargs['document'] = png_file
         request_kwargs['filename'] = f"{update.message.sticker.file_unique_id}.png"
@@ -82,6 +79,39 @@ def on_sticker_received(update: Update, context: CallbackContext):
     sent_message: Message = update.message.reply_document(**request_kwargs)
     sticker_file.close()
 
+    if static_sticker_as_png and sticker_file.is_static_sticker():
+        save_conversion(sent_message, sticker_file, png_options)
+
+    return sent_message
+
+
+@decorators.restricted
+@decorators.action(ChatAction.UPLOAD_DOCUMENT)
+@decorators.failwithmessage
+def on_sticker_received(update: Update, context: CallbackContext):
+    logger.info('user sent a sticker to convert')
+
+    sticker_file = StickerFile(update.message)
+
+    static_sticker_as_png = "png" in context.user_data
+    png_options = image.Options(image_format="png")
+
+    sent_message: Optional[Message] = None
+    if static_sticker_as_png and sticker_file.is_static_sticker():
+        sent_message = reply_cached_conversion(
+            update.message,
+            sticker_file,
+            png_options,
+            caption=sticker_file.get_emojis_str(),
+            disable_content_type_detection=True,
+            quote=True
+        )
+
+    if not sent_message:
+        sent_message = send_sticker_file(update, sticker_file, static_sticker_as_png, png_options)
+        if not sent_message:
+            return Status.WAITING_STICKER
+
     if sent_message.document:
         # only do this when we send the message as document
         # it will be useful to test problems with animated stickers. For example in mid 2020, the API started
@@ -114,24 +144,44 @@ def on_custom_emoji_receive(update: Update, context: CallbackContext):
         return Status.WAITING_STICKER
 
     sticker_file: StickerFile = StickerFile.from_entity(message.entities[0], context.bot)
-    sticker_file.download()
+
+    convert_to_png = update.effective_chat.type != Chat.CHANNEL and "png" in context.user_data
+    png_options = image.Options(image_format="png")
+
+    if convert_to_png and sticker_file.is_static_sticker():
+        cached_message = reply_cached_conversion(
+            message,
+            sticker_file,
+            png_options,
+            disable_content_type_detection=True,
+            caption=sticker_file.get_emojis_str(),
+            quote=True
+        )
+        if cached_message:
+            return Status.WAITING_STICKER
 
     logger.debug('downloading to bytes object')
     sticker_file.download()
 
     png_tempfile = None
-    if update.effective_chat.type != Chat.CHANNEL and "png" in context.user_data:
-        im = image.File(sticker_file.sticker_tempfile, image.Options(image_format="png"))
-        im.process()
-        png_tempfile = im.clone_result_tempfile(then_close=True)
+    if convert_to_png:
+        try:
+            png_tempfile = imagepool.pool.process(sticker_file.sticker_tempfile, png_options)
+        except imagepool.ImagePoolFull:
+            sticker_file.close()
+            message.reply_text(Strings.IMAGE_POOL_FULL, quote=True)
+            return Status.WAITING_STICKER
 
     file_to_send = png_tempfile or sticker_file.sticker_tempfile
     extension = sticker_file.get_extension(png=bool(png_tempfile))
     input_file = InputFile(file_to_send, filename=f"{sticker_file.file_unique_id}.{extension}")
 
-    message.reply_document(input_file, disable_content_type_detection=True, caption=sticker_file.get_emojis_str(), quote=True)
+    sent_message = message.reply_document(input_file, disable_content_type_detection=True, caption=sticker_file.get_emojis_str(), quote=True)
     sticker_file.close()
 
+    if png_tempfile:
+        save_conversion(sent_message, sticker_file, png_options)
+
     return Status.WAITING_STICKER
 
 
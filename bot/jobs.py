@@ -0,0 +1,193 @@
+import datetime
+import json
+import logging
+import threading
+import time
+from html import escape as html_escape
+from typing import Callable, Optional, List
+
+# noinspection PyPackageRequirements
+from telegram import Bot, Chat, Message, ParseMode
+# noinspection PyPackageRequirements
+from telegram.error import TelegramError
+
+from bot.database.base import session_scope
+from bot.database.models.job import Job, JobStatus
+from bot.strings import Strings
+
+logger = logging.getLogger(__name__)
+
+
+class JobContext:
+    """What a job function receives: the job's arguments, the checkpoint saved by a previous (interrupted)
+    run of the same job, and a bot instance to talk with the user"""
+
+    PROGRESS_SAVE_INTERVAL = 5  # seconds
+
+    def __init__(self, job: Job, bot: Bot):
+        self.job_id = job.job_id
+        self.job_type = job.job_type
+        self.user_id = job.user_id
+        self.chat_id = job.chat_id
+        self.payload = job.get_payload()
+        self.checkpoint = job.get_checkpoint()
+        self.bot = bot
+        self._progress_saved_at = 0.0
+
+    def is_resumed(self):
+        return bool(self.checkpoint)
+
+    def save_checkpoint(self, **kwargs):
+        """updates the checkpoint with the passed keys. If the bot is restarted, the job will be executed again
+        with this checkpoint"""
+        self.checkpoint.update(kwargs)
+
+        with session_scope() as session:
+            session.query(Job).filter_by(job_id=self.job_id).update(dict(
+                checkpoint=json.dumps(self.checkpoint),
+                updated_at=datetime.datetime.utcnow()
+            ))
+
+    def save_progress(self, done: int, total: int):
+        """saves how much of the job has been done, at most once every `PROGRESS_SAVE_INTERVAL` seconds
+        (the last step is always saved). Jobs can call it for each item they process"""
+        now = time.monotonic()
+        if done < total and now - self._progress_saved_at < self.PROGRESS_SAVE_INTERVAL:
+            return
+
+        self._progress_saved_at = now
+        with session_scope() as session:
+            session.query(Job).filter_by(job_id=self.job_id).update(dict(progress_done=done, progress_total=total))
+
+    def message(self, message_id: int) -> Message:
+        """returns a Message object that can be used to edit/reply to a message the bot sent in the job's chat"""
+        return Message(message_id, datetime.datetime.utcnow(), Chat(self.chat_id, Chat.PRIVATE), bot=self.bot)
+
+    def reply_html(self, text: str, reply_to_message_id: Optional[int] = None, **kwargs) -> Message:
+        return self.bot.send_message(
+            self.chat_id,
+            text,
+            parse_mode=ParseMode.HTML,
+            reply_to_message_id=reply_to_message_id,
+            allow_sending_without_reply=True,
+            **kwargs
+        )
+
+
+class PersistentJobQueue:
+    """A queue of long-running operations stored in the database. Jobs are executed by dedicated worker threads
+    (not the dispatcher's ones), and jobs that were running when the bot has been stopped are executed again
+    when it restarts: job functions can use `JobContext.checkpoint` to resume from where they stopped"""
+
+    POLL_INTERVAL = 5  # seconds
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self._job_functions = dict()
+        self._wakeup = threading.Event()
+        self._claim_lock = threading.Lock()
+        self._threads = list()
+
+    def register(self, job_type: str):
+        def real_decorator(func: Callable[[JobContext], None]):
+            logger.info('registering job function: %s', job_type)
+            self._job_functions[job_type] = func
+            return func
+
+        return real_decorator
+
+    def enqueue(self, job_type: str, user_id: int, chat_id: int, payload: Optional[dict] = None) -> int:
+        if job_type not in self._job_functions:
+            raise ValueError('unknown job type: {}'.format(job_type))
+
+        with session_scope() as session:
+            job = Job(job_type, user_id, chat_id, payload or {})
+            session.add(job)
+            session.flush()
+            job_id = job.job_id
+
+        logger.info('job %d (%s) queued', job_id, job_type)
+        self._wakeup.set()
+
+        return job_id
+
+    @staticmethod
+    def user_jobs(user_id: int, limit: int = 10) -> List[dict]:
+        with session_scope() as session:
+            jobs = session.query(Job).filter_by(user_id=user_id).order_by(Job.job_id.desc()).limit(limit).all()
+            return [dict(
+                job_id=job.job_id,
+                job_type=job.job_type,
+                status=job.status,
+                payload=job.get_payload(),
+                progress_done=job.progress_done,
+                progress_total=job.progress_total,
+                error=job.error
+            ) for job in jobs]
+
+    def start(self, bot: Bot, workers: int = 1):
+        self.bot = bot
+
+        with session_scope() as session:
+            interrupted_jobs = session.query(Job).filter_by(status=JobStatus.RUNNING).update(dict(status=JobStatus.QUEUED))
+        if interrupted_jobs:
+            logger.info('%d interrupted jobs will be resumed', interrupted_jobs)
+
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name='JobWorker-{}'.format(i), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _claim_next_job(self) -> Optional[JobContext]:
+        with self._claim_lock, session_scope() as session:
+            job: Job = session.query(Job).filter_by(status=JobStatus.QUEUED).order_by(Job.job_id).first()
+            if not job:
+                return
+
+            job.status = JobStatus.RUNNING
+            job.updated_at = datetime.datetime.utcnow()
+
+            return JobContext(job, self.bot)
+
+    @staticmethod
+    def _set_status(job_id: int, status: str, error: Optional[str] = None):
+        with session_scope() as session:
+            session.query(Job).filter_by(job_id=job_id).update(dict(
+                status=status,
+                error=error,
+                updated_at=datetime.datetime.utcnow()
+            ))
+
+    def _worker(self):
+        while True:
+            job = self._claim_next_job()
+            if not job:
+                self._wakeup.wait(self.POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+
+            job_function = self._job_functions.get(job.job_type)
+            if not job_function:
+                logger.error('job %d: no function registered for job type %s', job.job_id, job.job_type)
+                self._set_status(job.job_id, JobStatus.FAILED, 'unknown job type')
+                continue
+
+            logger.info('job %d (%s): starting (resumed: %s)', job.job_id, job.job_type, job.is_resumed())
+
+            # noinspection PyBroadException
+            try:
+                job_function(job)
+            except Exception as e:
+                logger.error('job %d (%s): error while running the job', job.job_id, job.job_type, exc_info=True)
+                self._set_status(job.job_id, JobStatus.FAILED, str(e))
+
+                try:
+                    job.reply_html(Strings.JOB_FAILED.format(job.job_id, html_escape(str(e))))
+                except TelegramError as telegram_error:
+                    logger.error('job %d: cannot notify the user: %s', job.job_id, telegram_error.message)
+            else:
+                logger.info('job %d (%s): done', job.job_id, job.job_type)
+                self._set_status(job.job_id, JobStatus.DONE)
+
+
+queue = PersistentJobQueue()
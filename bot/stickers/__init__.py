@@ -1,2 +1,3 @@
 from .sticker import StickerFile
-from .requests import send_request
+from .requests import send_request, send_sticker_request
+from .conversions import reply_cached_conversion, save_conversion
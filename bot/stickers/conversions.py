@@ -0,0 +1,72 @@
+import datetime
+import logging
+from typing import Optional
+
+# noinspection PyPackageRequirements
+from telegram import Message
+# noinspection PyPackageRequirements
+from telegram.error import BadRequest
+
+from config import config
+from .sticker import StickerFile
+from ..database.base import session_scope
+from ..database.models.converted_file import ConvertedFile
+from ..utils import image
+
+logger = logging.getLogger(__name__)
+
+
+def conversion_cache_key(file_unique_id: str, options: image.Options) -> str:
+    return f"{file_unique_id}:{options.cache_key()}"
+
+
+def get_converted_file_id(file_unique_id: str, options: image.Options) -> Optional[str]:
+    with session_scope() as session:
+        converted_file: ConvertedFile = session.query(ConvertedFile).filter_by(key=conversion_cache_key(file_unique_id, options)).first()
+        if not converted_file:
+            return
+
+        converted_file.last_used = datetime.datetime.utcnow()
+        return converted_file.file_id
+
+
+def save_converted_file_id(file_unique_id: str, options: image.Options, file_id: str):
+    max_entries = config.get('stickers', {}).get('conversions_cache_max_entries', 10000)
+    if not max_entries:
+        return
+
+    with session_scope() as session:
+        session.merge(ConvertedFile(conversion_cache_key(file_unique_id, options), file_unique_id, file_id))
+        session.flush()
+
+        # least recently used entries exceeding the limit
+        keys_to_delete = [row.key for row in session.query(ConvertedFile.key).order_by(ConvertedFile.last_used.desc()).offset(max_entries)]
+        if keys_to_delete:
+            logger.debug('removing %d file_ids from the conversions cache', len(keys_to_delete))
+            session.query(ConvertedFile).filter(ConvertedFile.key.in_(keys_to_delete)).delete('fetch')
+
+
+def delete_converted_file_id(file_unique_id: str, options: image.Options):
+    with session_scope() as session:
+        session.query(ConvertedFile).filter_by(key=conversion_cache_key(file_unique_id, options)).delete()
+
+
+def reply_cached_conversion(message: Message, sticker_file: StickerFile, options: image.Options, **kwargs) -> Optional[Message]:
+    """If we already converted this sticker with the same options, sends the converted document again using its file_id,
+    so the sticker doesn't need to be downloaded and processed. Returns None if there's no usable cached file_id"""
+
+    file_id = get_converted_file_id(sticker_file.file_unique_id, options)
+    if not file_id:
+        return
+
+    logger.debug('sending cached conversion of %s', sticker_file.file_unique_id)
+    try:
+        return message.reply_document(file_id, **kwargs)
+    except BadRequest as e:
+        logger.info('the cached file_id of %s has been rejected (%s), converting again', sticker_file.file_unique_id, e.message)
+        delete_converted_file_id(sticker_file.file_unique_id, options)
+
+
+def save_conversion(sent_message: Message, sticker_file: StickerFile, options: image.Options):
+    if sent_message.document:
+        save_converted_file_id(sticker_file.file_unique_id, options, sent_message.document.file_id)
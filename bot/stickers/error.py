@@ -40,6 +40,10 @@ class InvalidAnimatedSticker(StickerError):
     pass
 
 
+class FileIdInvalid(StickerError):
+    pass
+
+
 class FloodControlExceeded(StickerError):
     pass
 
@@ -76,6 +80,11 @@ EXCEPTIONS = {
     # https://core.telegram.org/animated_stickers
     'Wrong file type': InvalidAnimatedSticker,
 
+    # we passed a file_id that cannot be used as sticker file
+    r'wrong (remote )?file (identifier|id)': FileIdInvalid,
+    "file_id doesn't correspond": FileIdInvalid,
+    'STICKER_PNG_NOPNG': FileIdInvalid,
+
     # too many attempts at creating the pack
     'Flood control exceeded': FloodControlExceeded,
 
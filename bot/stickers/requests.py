@@ -1,9 +1,20 @@
+import datetime
 import logging
 import re
+from typing import Optional
 
+# noinspection PyPackageRequirements
+from telegram import Bot, File
+# noinspection PyPackageRequirements
 from telegram.error import BadRequest, TelegramError
 
-from .error import EXCEPTIONS
+from config import config
+from constants.stickers import MimeType, STATIC_STICKER_SIZE
+from .error import EXCEPTIONS, FileIdInvalid, FileDimensionInvalid
+from .sticker import StickerFile
+from ..database.base import session_scope
+from ..database.models.uploaded_sticker import UploadedSticker
+from ..utils import image
 
 logger = logging.getLogger(__name__)
 
@@ -26,3 +37,90 @@ def send_request(func, request_payload: dict):
     except (BadRequest, TelegramError) as e:
         logger.error('Telegram exception while trying to execute function <%s>: %s', func.__name__, e.message)
         raise_exception(e.message)
+
+
+# errors Telegram returns when it doesn't accept the file_id we passed instead of uploading the file. Other errors
+# (eg. timeouts, that end up as UnknwonError) must not trigger an upload: the request might have succeeded, and the
+# sticker would be added twice
+FILE_ID_REJECTED_EXCEPTIONS = (FileIdInvalid, FileDimensionInvalid)
+
+
+def get_uploaded_file_id(file_unique_id: str) -> Optional[str]:
+    with session_scope() as session:
+        uploaded_sticker: UploadedSticker = session.query(UploadedSticker).filter_by(file_unique_id=file_unique_id).first()
+        if not uploaded_sticker:
+            return
+
+        uploaded_sticker.last_used = datetime.datetime.utcnow()
+        return uploaded_sticker.file_id
+
+
+def save_uploaded_file_id(file_unique_id: str, file_id: str):
+    max_entries = config.get('stickers', {}).get('uploads_cache_max_entries', 10000)
+    if not max_entries:
+        return
+
+    with session_scope() as session:
+        session.merge(UploadedSticker(file_unique_id, file_id))
+        session.flush()
+
+        # least recently used entries exceeding the limit
+        ids_to_delete = [row.file_unique_id for row in session.query(UploadedSticker.file_unique_id).order_by(UploadedSticker.last_used.desc()).offset(max_entries)]
+        if ids_to_delete:
+            logger.debug('removing %d file_ids from the uploads cache', len(ids_to_delete))
+            session.query(UploadedSticker).filter(UploadedSticker.file_unique_id.in_(ids_to_delete)).delete('fetch')
+
+
+def delete_uploaded_file_id(file_unique_id: str):
+    with session_scope() as session:
+        session.query(UploadedSticker).filter_by(file_unique_id=file_unique_id).delete()
+
+
+def get_reusable_file_id(sticker_file: StickerFile) -> Optional[str]:
+    """returns a file_id we can pass to the Bot API instead of uploading the sticker file, if there's one.
+    Animated/video stickers can only be uploaded"""
+
+    if not sticker_file.is_static_sticker():
+        return
+    elif sticker_file.is_sticker():
+        if image.needs_resize((sticker_file.sticker.width, sticker_file.sticker.height), STATIC_STICKER_SIZE):
+            # eg. custom emojis: Telegram would reject the file_id, the file must be resized
+            return
+
+        return sticker_file.sticker.file_id
+    else:
+        return get_uploaded_file_id(sticker_file.file_unique_id)
+
+
+def send_sticker_request(bot: Bot, func, request_payload: dict, sticker_file: StickerFile):
+    """Executes a request that needs the sticker file (`add_sticker_to_set`/`create_new_sticker_set`).
+
+    We first try to pass the file_id of the sticker (or of the resized document we uploaded the last time we
+    received it), so nothing needs to be downloaded or uploaded. If Telegram rejects it, the file is downloaded,
+    checked locally, resized/re-encoded if needed and uploaded"""
+
+    file_id = get_reusable_file_id(sticker_file)
+    if file_id:
+        try:
+            return send_request(func, {**request_payload, sticker_file.api_arg_name: file_id})
+        except FILE_ID_REJECTED_EXCEPTIONS as e:
+            logger.info('the file_id of %s has been rejected (%s), uploading the file', sticker_file.file_unique_id, e.message)
+            if sticker_file.is_document():
+                delete_uploaded_file_id(sticker_file.file_unique_id)
+
+    sticker_file.download()
+
+    if sticker_file.is_static_sticker():
+        sticker_file.prepare_static_sticker()  # checks the file and resizes/re-encodes it if Telegram would reject it
+
+    if sticker_file.is_static_sticker() and sticker_file.is_document(MimeType.PNG):
+        # upload the (resized) png once, so the next time we receive this document we can just pass its file_id
+        uploaded_file: File = send_request(bot.upload_sticker_file, dict(
+            user_id=request_payload['user_id'],
+            png_sticker=sticker_file.get_input_file()
+        ))
+        save_uploaded_file_id(sticker_file.file_unique_id, uploaded_file.file_id)
+
+        return send_request(func, {**request_payload, sticker_file.api_arg_name: uploaded_file.file_id})
+
+    return send_request(func, {**request_payload, sticker_file.api_arg_name: sticker_file.get_input_file()})
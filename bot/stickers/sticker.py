@@ -1,3 +1,4 @@
+import io
 import logging
 import tempfile
 # noinspection PyPackageRequirements
@@ -5,14 +6,20 @@ from typing import Union, Optional
 
 from telegram import Sticker, Document, InputFile, Bot, Message, File, MessageEntity
 
-from constants.stickers import StickerType, MimeType
+from constants.stickers import StickerType, MimeType, MAX_STATIC_STICKER_FILE_SIZE, STATIC_STICKER_SIZE
+from .error import FileTooBig
+from ..utils import blobs
 from ..utils import image
+from ..utils import imagepool
+from ..utils import singleflight
 from ..utils.pyrogram import get_sticker_emojis
 
 # noinspection PyPackageRequirements
 
 logger = logging.getLogger('StickerFile')
 
+downloads = singleflight.SingleFlight()
+
 
 class MessageScaffold:
     def __init__(self, sticker: Sticker):
@@ -135,6 +142,13 @@ class StickerFile:
         self.sticker_tempfile.seek(0)
         return self.sticker_tempfile
 
+    def tempfile_size(self) -> int:
+        self.sticker_tempfile.seek(0, 2)
+        size = self.sticker_tempfile.tell()
+        self.sticker_tempfile.seek(0)
+
+        return size
+
     def get_input_file(self):
         """returns a telegram InputFile"""
         if self.is_animated_sticker():
@@ -150,12 +164,46 @@ class StickerFile:
 
         return InputFile(self.sticker_tempfile, filename=f"{self.file_unique_id}.{extension}")
 
-    def download(self):
+    def _download_from_cache(self, out: io.BytesIO) -> bool:
+        # noinspection PyBroadException
+        try:
+            return blobs.cache.get(self.file_unique_id, out)
+        except Exception as e:
+            logger.error('error while reading the stickers from the blob cache: %s', str(e))
+            out.seek(0)
+            out.truncate()
+            return False
+
+    def _save_to_cache(self, data: io.BytesIO):
+        # noinspection PyBroadException
+        try:
+            blobs.cache.put(self.file_unique_id, data, size=self.sticker.file_size)
+        except Exception as e:
+            logger.error('error while saving the stickers to the blob cache: %s', str(e))
+
+    def _fetch(self) -> bytes:
+        out = io.BytesIO()
+        if self._download_from_cache(out):
+            logger.debug('stickers found in the blob cache')
+            return out.getvalue()
+
         logger.debug('downloading stickers')
         new_file: File = self.sticker.get_file()
 
         logger.debug('downloading to bytes object')
-        new_file.download(out=self.sticker_tempfile)
+        new_file.download(out=out)
+
+        out.seek(0)
+        self._save_to_cache(out)
+
+        return out.getvalue()
+
+    def download(self):
+        # concurrent downloads of the same file (eg. a popular sticker, or a custom emoji posted in a channel)
+        # wait for the first one and share its bytes
+        data = downloads.do(self.file_unique_id, self._fetch)
+
+        self.sticker_tempfile.write(data)
         self.sticker_tempfile.seek(0)
 
     def close(self):
@@ -165,23 +213,43 @@ class StickerFile:
         except Exception as e:
             logger.error('error while trying to close stickers tempfile: %s', str(e))
 
-    def add_to_pack_prepare_sticker_document(self):
-        # shortcut method to make sure a document is ready to be added to a pack
+    def prepare_static_sticker(self):
+        """makes sure the downloaded file of a static sticker/document is accepted by Telegram, so we don't waste
+        an upload: the file is checked locally and, if needed, resized/re-encoded. Raises FileTooBig if we can't
+        make it small enough, and the exceptions of image.get_sticker_issues() if it can't be processed at all"""
 
-        if not self.is_static_sticker() and not self.is_document():
-            raise ValueError("sticker is not static or is not a `telegram.Document` instance")
+        if not self.is_static_sticker():
+            raise ValueError("sticker is not static")
 
-        options = image.Options(image_format=self.get_extension(), max_size=512)
-        im = image.File(self.sticker_tempfile, options)
+        options = image.Options(
+            image_format=self.get_extension(),
+            max_size=STATIC_STICKER_SIZE,
+            max_file_size=MAX_STATIC_STICKER_FILE_SIZE,
+            encoder_profile="small"  # it will be uploaded
+        )
 
-        # check whether we need to resize png/webp documents or not
-        if im.sticker_needs_resize():
-            logger.info("resizing %s file...", options.image_format)
-            im.process()
-            # override the sticker tempfile, we need a better way to do that
-            self.sticker_tempfile = im.clone_result_tempfile(then_close=True)
-        else:
-            im.close()
+        file_size = self.tempfile_size()
+        issues = image.get_sticker_issues(self.sticker_tempfile, file_size, options)
+        if not issues:
+            logger.debug("the file doesn't need to be processed")
+            return
+
+        logger.info("processing %s file: %s", options.image_format, "; ".join(issues))
+        resized_tempfile = imagepool.pool.process(self.sticker_tempfile, options)
+
+        resized_tempfile.seek(0, 2)
+        resized_file_size = resized_tempfile.tell()
+        logger.info("%s file processed (size: %d -> %d bytes)", options.image_format, file_size, resized_file_size)
+
+        if resized_file_size > MAX_STATIC_STICKER_FILE_SIZE:
+            # Telegram would reject it: do not upload it
+            resized_tempfile.close()
+            raise FileTooBig('the encoded file is {} bytes'.format(resized_file_size))
+
+        # replace the sticker tempfile with the resized image
+        resized_tempfile.seek(0)
+        self.sticker_tempfile.close()
+        self.sticker_tempfile = resized_tempfile
 
     def __repr__(self):
         return 'StickerFile object of original origin {} (type: {})'.format(
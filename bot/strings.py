@@ -19,6 +19,7 @@ class Strings:
                     "- /cleanup: remove from the list of your packs all the packs that you have deleted using @stickers\n"
                     "- /tofile: convert stickers and custom emojis to file\n"
                     "- /toemoji: resize a static stickers so it can be added to a custom emojis pack\n"
+                    "- /jobs: see the status of your latest exports (and other long operations)\n"
                     "\n"
                     "<b>Other operations</b>\n"
                     "You can delete a pack, change a stickers's emojis, change stickers order and see a stickers/pack stats from @stickers\n"
@@ -29,6 +30,9 @@ class Strings:
                     "- when adding a stickers as png, you can pass its emojis in the caption\n"
                     "- /tofile supports a <code>-png</code> flag: it will make the bot send static stickers/emojis "
                     "as png instead of webp\n"
+                    "- /export supports a <code>-new</code> flag: it will export only the stickers added to the pack "
+                    "since the last time you exported it (and the ones I failed to export), plus the updated "
+                    "<code>emojis.json</code> file\n"
                     "- /toemoji supports the following flags: <code>-c</code> (will crop away the transparent space "
                     "at the image's borders) and <code>-r</code> (will not maintain the image's aspect rateo if "
                     "it's not square)\n"
@@ -159,6 +163,17 @@ class Strings:
                               "I can't add this stickers to the pack due to wrong resizing logic.\n"
                               "Send me another stickers, or use /done when you're done")
 
+    IMAGE_POOL_FULL = "I'm processing too many images right now, please try again in a few seconds"
+
+    ADD_STICKER_FILE_TOO_BIG = ("This file is too big to be used as a sticker (max {} kb), and I couldn't make it "
+                                "smaller without ruining it. Send me another file, or use /done when you're done")
+
+    ADD_STICKER_IMAGE_TOO_LARGE = ("This image is too large for me to process (it has too many pixels). Send me "
+                                   "a smaller one, or use /done when you're done")
+
+    ADD_STICKER_INVALID_IMAGE = ("I can't read this image, it might be damaged or in a format I don't support. "
+                                 "Send me a png/webp file, or use /done when you're done")
+
     ADD_STICKER_INVALID_ANIMATED = ("It looks like this stickers is no loger compliant with the most recent "
                                     "<a href=\"https://core.telegram.org/animated_stickers\">Telegram guidelines</a> "
                                     "about animated stickers. I'm sorry but I can't add it :(\n"
@@ -270,7 +285,17 @@ class Strings:
 
     EXPORT_SKIPPED_STICKERS = " - I wasn't able to export {} stickers!"
 
-    EXPORT_ONGOING = "Hold on, the export is processing..."
+    EXPORT_VOLUME = " (part {}/{})"
+
+    EXPORT_PACK_QUEUED = "Your export has been queued, it will start in a moment. You can use /jobs to see its status"
+
+    EXPORT_NEW_NEVER_EXPORTED = "You never exported this pack before, I will export all its stickers"
+
+    EXPORT_NEW_NOTHING_NEW = "No sticker has been added to this pack since your last export"
+
+    EXPORT_NEW_STICKERS_COUNT = " - {} new stickers since your last export"
+
+    EXPORT_NEW_PREVIOUSLY_FAILED_COUNT = " - {} stickers I wasn't able to export last time"
 
     CLEANUP_NO_PACK = ("It looks like all your packs are still there. No pack has been removed from the database.\n"
                        "If you just deleted a pack from @stickers, remember that it might take some time for bots "
@@ -281,6 +306,14 @@ class Strings:
 
     CLEANUP_WAIT = "Hold on, this operation might take some time..."
 
+    COUNT_WAIT = "Hold on, this might take some time..."
+
+    JOB_FAILED = "An error occurred while processing your request (job #{}): <code>{}</code>"
+
+    JOBS_NO_JOBS = "You didn't request any long operation (/export, /count or /cleanup) recently"
+
+    JOBS_HEADER = "<b>Your latest operations</b>:\n"
+
     TO_FILE_MIME_TYPE = "mime-type: {}"
 
     TO_EMOJI_WAITING_STICKER = "Send me a static sticker, " \
@@ -1,3 +1,9 @@
 from .helpers import utils
 from .helpers import decorators
 from .helpers import image
+from .helpers import imagepool
+from .helpers import upload
+from .helpers import progress
+from .helpers import blobs
+from .helpers import singleflight
+from .helpers import fileid
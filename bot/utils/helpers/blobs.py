@@ -0,0 +1,179 @@
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class BlobCache:
+    """An on-disk store of files downloaded from Telegram, keyed by their `file_unique_id`. A file_unique_id always
+    identifies the same content, so cached files never need to be revalidated.
+
+    The total size of the stored files is kept below `max_bytes` by removing the least recently used ones. Files are
+    written to a temporary file and then renamed, so readers (even in other processes sharing the same directory)
+    never see a partially written file"""
+
+    TEMPFILE_PREFIX = '.tmp-'
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._index = OrderedDict()  # file_unique_id -> size, least recently used first
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def start(self):
+        """Creates the directory and loads the files that are already there. Until the cache is started, nothing
+        is read from or written to it"""
+        if not self.enabled or self._started:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+        self._started = True
+
+    def _load_index(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+
+            if entry.name.startswith(self.TEMPFILE_PREFIX):
+                # left there by a write that has been interrupted
+                self._remove_file(entry.path)
+                continue
+
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        # we touch files when they are read, so the mtime tells us which ones have been used last
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self.total_bytes += size
+
+        logger.info('blob cache: %d files (%d bytes) in %s', len(self._index), self.total_bytes, self.directory)
+
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def _key(file_unique_id: str) -> str:
+        # file_unique_ids are url-safe base64 strings, but we do not want to trust them to build a path
+        if not re.match(r'^[A-Za-z0-9_\-]+$', file_unique_id):
+            raise ValueError('invalid file_unique_id: {}'.format(file_unique_id))
+
+        return file_unique_id
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """removes the least recently used files until the total size is below the budget. Must be called while
+        holding the lock"""
+        while self.total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self.total_bytes -= size
+            self._remove_file(self._path(key))
+            logger.debug('blob cache: evicted %s (%d bytes)', key, size)
+
+    def get(self, file_unique_id: str, out: BinaryIO) -> bool:
+        """Copies the cached file into `out`. Returns False if the file is not cached"""
+        if not self._started:
+            return False
+
+        key = self._key(file_unique_id)
+        path = self._path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out)
+            os.utime(path)
+        except FileNotFoundError:
+            # never cached, or evicted by another process sharing the directory
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self.total_bytes -= size
+
+            return False
+
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+            else:
+                # written by another process sharing the directory
+                size = os.path.getsize(path)
+                self._index[key] = size
+                self.total_bytes += size
+                self._evict()
+
+        logger.debug('blob cache: hit for %s', key)
+        return True
+
+    def put(self, file_unique_id: str, data: BinaryIO, size: Optional[int] = None):
+        """Stores the content of `data` (from its current position) in the cache"""
+        if not self._started:
+            return
+
+        key = self._key(file_unique_id)
+        if size is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            # we don't need to write it again: the content of a file_unique_id never changes
+            if key in self._index:
+                self._index.move_to_end(key)
+                return
+
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=self.TEMPFILE_PREFIX, delete=False) as f:
+            temp_path = f.name
+            try:
+                shutil.copyfileobj(data, f)
+                size = f.tell()
+            except BaseException:
+                f.close()
+                self._remove_file(temp_path)
+                raise
+
+        if size > self.max_bytes:
+            # it would evict everything else
+            self._remove_file(temp_path)
+            return
+
+        os.replace(temp_path, self._path(key))
+
+        with self._lock:
+            if key in self._index:
+                # another thread stored it in the meantime: we replaced it with the same content
+                self.total_bytes -= self._index.pop(key)
+
+            self._index[key] = size
+            self.total_bytes += size
+            self._evict()
+
+        logger.debug('blob cache: stored %s (%d bytes, total: %d)', key, size, self.total_bytes)
+
+
+cache = BlobCache(
+    directory=config.get('blob_cache', {}).get('directory', 'blobs'),
+    max_bytes=config.get('blob_cache', {}).get('max_mb', 256) * 1024 * 1024
+)
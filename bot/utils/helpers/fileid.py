@@ -0,0 +1,90 @@
+import base64
+import struct
+from typing import Tuple
+
+# flags of the file type id. Files with a web location are not stored on Telegram's servers: they don't have an id
+WEB_LOCATION_FLAG = 1 << 24
+FILE_REFERENCE_FLAG = 1 << 25
+
+# the file_ids of files of these types contain the id of the photo, not of a document
+PHOTO_FILE_TYPES = (
+    0,  # thumbnail
+    1,  # profile photo
+    2,  # photo
+)
+
+
+class InvalidFileId(Exception):
+    pass
+
+
+def rle_decode(data: bytes) -> bytes:
+    """file_ids are run-length encoded: a zero byte is followed by the number of zero bytes it stands for"""
+
+    result = bytearray()
+    zero = False
+    for byte in data:
+        if zero:
+            result.extend(b"\x00" * byte)
+            zero = False
+        elif byte == 0:
+            zero = True
+        else:
+            result.append(byte)
+
+    return bytes(result)
+
+
+def decode_file_id(file_id: str) -> Tuple[int, int, int, int]:
+    """Returns the (file type, dc id, media id, access hash) encoded in a Bot API file_id, without requesting
+    anything to Telegram. For stickers and other documents, the media id is the id of the MTProto document.
+
+    Both the current format (used by the Bot API since version 4.9) and the older one, that doesn't include the
+    file reference, are supported. Raises InvalidFileId if the file_id can't be decoded"""
+
+    try:
+        data = rle_decode(base64.urlsafe_b64decode(file_id + "=" * (-len(file_id) % 4)))
+    except ValueError as e:
+        raise InvalidFileId("{}: {}".format(file_id, str(e)))
+
+    if not data:
+        raise InvalidFileId("{}: empty file_id".format(file_id))
+
+    # the last byte is the version. From version 4, it's preceded by a sub version
+    data = data[:-2] if data[-1] >= 4 else data[:-1]
+
+    try:
+        file_type, dc_id = struct.unpack_from("<ii", data)
+        offset = 8
+
+        if file_type & WEB_LOCATION_FLAG:
+            raise InvalidFileId("{}: the file has a web location, not an id".format(file_id))
+
+        if file_type & FILE_REFERENCE_FLAG:
+            # TL-serialized bytes, padded to a multiple of 4 bytes
+            length = data[offset]
+            if length < 254:
+                header_length = 1
+            else:
+                length = int.from_bytes(data[offset + 1:offset + 4], "little")
+                header_length = 4
+            offset += header_length + length
+            offset += -offset % 4
+
+        media_id, access_hash = struct.unpack_from("<qq", data, offset)
+    except (struct.error, IndexError) as e:
+        raise InvalidFileId("{}: {}".format(file_id, str(e)))
+
+    file_type &= ~(WEB_LOCATION_FLAG | FILE_REFERENCE_FLAG)
+
+    return file_type, dc_id, media_id, access_hash
+
+
+def get_document_id(file_id: str) -> int:
+    """returns the id of the MTProto document of a Bot API file_id (eg. of a sticker)"""
+
+    file_type, _, media_id, _ = decode_file_id(file_id)
+    if file_type in PHOTO_FILE_TYPES:
+        raise InvalidFileId("{}: the file is a photo, not a document".format(file_id))
+
+    return media_id
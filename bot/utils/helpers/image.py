@@ -1,25 +1,94 @@
 import logging
 import math
 import tempfile
-from typing import Optional
+from typing import Optional, List, BinaryIO
 
 import numpy as np
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 from PIL.Image import Image as ImageType  # https://stackoverflow.com/a/58236618/13350541
 
 logger = logging.getLogger(__name__)
 
+# encoder settings to try, in order, when the encoded image must not exceed a size. Each step gives up a bit more
+# quality: png steps are lossless until the image is quantized, webp steps lower the quality of the lossy encoding
+# (a lossless webp is almost always larger than a lossy one, so it's never tried).
+# A 512x512 image quantized to 256 colors is always smaller than 512 kb, so the last png step always fits
+# the size limit of static stickers
+SIZE_TARGETED_ENCODER_SETTINGS = {
+    "png": (
+        dict(),
+        dict(optimize=True),
+        dict(optimize=True, quantize=True),
+    ),
+    "webp": (
+        dict(),  # the encoder profile's settings (lossy, quality 80 by default)
+        dict(lossless=False, quality=60),
+        dict(lossless=False, quality=40),
+    )
+}
+
+# encoder settings of each profile, SIZE_TARGETED_ENCODER_SETTINGS are applied on top of them.
+# "small" is for files that are uploaded to Telegram. Run benchmarks/encoder_profiles.py to compare the encoder
+# settings. Compared to "default", with 512x512 images:
+# - small: webp 10-35% more time, 2-5% smaller (method 6 takes 10x the time for 1% less); png 2x time with drawings
+#   for 20% less (~same time and size with noisy images)
+# - png compress_level 1 saves ~40% of the time only with noisy images (~no gain with drawings, which most stickers
+#   are) and makes files 10-150% larger, so files the user is waiting for (/tofile) use the default settings
+ENCODER_PROFILES = {
+    "default": {
+        "png": dict(),  # compress_level 6
+        "webp": dict(),  # lossy, quality 80, method 4
+    },
+    "small": {
+        "png": dict(compress_level=9),
+        "webp": dict(method=5),
+    },
+}
+
+# images larger than `RESIZE_REDUCING_GAP` times the target size are first shrunk with reduce(): with 3.0, the result
+# is indistinguishable from a full Lanczos resample (see Image.resize() docs)
+RESIZE_REDUCING_GAP = 3.0
+
+PREMULTIPLIED_MODES = {"RGBA": "RGBa", "LA": "La"}
+UNPREMULTIPLIED_MODES = {"RGBa": "RGBA", "La": "LA"}
+
+# images that would need more memory to be decoded are rejected before decoding them (see get_decoding_memory()).
+# This is what bounds the memory used by an image: png/webp images can only be decoded at full size, JPEG images
+# are decoded at a reduced size when possible (see open_image())
+MAX_DECODING_MEMORY = 256 * 1024 * 1024
+# Pillow's webp decoder keeps a few copies of the decoded frame: it uses about 4 times the image's size
+DECODING_MEMORY_MULTIPLIERS = {"WEBP": 4}
+# number of pixels of the decoded image reduce_in_strips() copies at a time. Smaller images are reduced in one go
+STRIP_PIXELS = 1024 * 1024
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class InvalidImage(Exception):
+    pass
+
 
 class Options:
-    def __init__(self, image_format="webp", max_size=512, square=False, keep_aspect_rateo=False, crop_transparent_areas=False):
+    def __init__(self, image_format="webp", max_size=512, square=False, keep_aspect_rateo=False, crop_transparent_areas=False,
+                 alpha_threshold=255, max_file_size=None, encoder_profile="default"):
         if image_format not in ("webp", "png"):
             raise ValueError("only png/webp formats are supported")
+        if encoder_profile not in ENCODER_PROFILES:
+            raise ValueError("unknown encoder profile: {}".format(encoder_profile))
 
         self.image_format = image_format
         self.max_size = max_size
         self.square = square
         self.keep_aspect_rateo = keep_aspect_rateo
         self.crop_transparent_areas = crop_transparent_areas
+        # when cropping transparent areas, pixels with a lower alpha value are considered transparent
+        self.alpha_threshold = alpha_threshold
+        # if set, the encoder will try smaller settings until the encoded image is not larger than this (in bytes)
+        self.max_file_size = max_file_size
+        # see ENCODER_PROFILES
+        self.encoder_profile = encoder_profile
 
     @property
     def crop(self):
@@ -33,9 +102,18 @@ class Options:
     def format(self):
         return self.image_format
 
+    def cache_key(self) -> str:
+        """returns a string that is the same for all the Options that produce the same result"""
+
+        return f"{self.image_format}:{self.max_size}:{int(self.square)}:{int(self.keep_aspect_rateo)}:" \
+               f"{int(self.crop_transparent_areas)}:{self.alpha_threshold if self.crop_transparent_areas else ''}:" \
+               f"{self.max_file_size or ''}:{self.encoder_profile}"
+
     def __str__(self):
         return f"image_format: {self.image_format}; max_size: {self.max_size}: square: {self.square}; " \
-               f"keep_aspect_rateo: {self.keep_aspect_rateo}; crop_transparent_areas: {self.crop_transparent_areas}"
+               f"keep_aspect_rateo: {self.keep_aspect_rateo}; crop_transparent_areas: {self.crop_transparent_areas}; " \
+               f"alpha_threshold: {self.alpha_threshold}; max_file_size: {self.max_file_size}; " \
+               f"encoder_profile: {self.encoder_profile}"
 
 
 def is_square(im: Image) -> bool:
@@ -43,42 +121,137 @@ def is_square(im: Image) -> bool:
     return size[0] == size[1]
 
 
-def crop_transparency(im: Image) -> ImageType:
-    # https://stackoverflow.com/a/37942933
+def get_alpha_band(im: Image) -> Optional[np.ndarray]:
+    """returns a 2D array with the alpha value of each pixel, or None if the image has no transparency.
+    Only the alpha band is read: we never copy the whole pixels buffer"""
+
+    if im.mode == "RGBA":
+        # the raw packer can extract the alpha band directly (getchannel() would create a new image first)
+        return np.frombuffer(im.tobytes("raw", "A"), dtype=np.uint8).reshape(im.height, im.width)
+    elif im.mode in ("LA", "La", "RGBa", "PA"):
+        return np.asarray(im.getchannel("A"))
+    elif im.mode == "P" and ("transparency" in im.info or im.palette.mode == "RGBA"):
+        # the alpha value is a property of the palette entries: map each pixel's palette index to its alpha value
+        palette_alpha = np.full(256, 255, dtype=np.uint8)
+        if im.palette.mode == "RGBA":
+            palette_alpha_values = np.frombuffer(bytes(im.getpalette("RGBA")), dtype=np.uint8)[3::4]
+            palette_alpha[:len(palette_alpha_values)] = palette_alpha_values
+        elif isinstance(im.info["transparency"], bytes):
+            transparency = np.frombuffer(im.info["transparency"], dtype=np.uint8)
+            palette_alpha[:len(transparency)] = transparency
+        else:
+            palette_alpha[im.info["transparency"]] = 0
 
-    image_data = np.asarray(im)
-    try:
-        image_data_bw = image_data[:, :, 3]  # just extract the alpha value
-    except IndexError as ie:
-        # numpy can't extract the 3rd index, probably because there is no alpha channel
-        # return the image itself
-        logger.warning("error while extracting the alpha channel values: %s", str(ie))
-        return im.copy()  # we need to return a new object and not the old one, because it iwll be closed later
+        # point() maps the palette indexes in C, it's faster than indexing `palette_alpha` with a numpy array
+        return np.asarray(im.point(palette_alpha.tolist()))
+
+    return None
+
+
+def get_alpha_bbox(im: Image, alpha_threshold=255) -> Optional[tuple]:
+    """returns the (left, upper, right, lower) box containing all the pixels with alpha value >= `alpha_threshold`.
+    Returns None if the image has no transparency or if there's no such pixel"""
+
+    alpha = get_alpha_band(im)
+    if alpha is None:
+        return None
+
+    # max() of each row/column is much faster than comparing every pixel with the threshold
+    non_empty_rows = np.flatnonzero(alpha.max(axis=1) >= alpha_threshold)
+    if not non_empty_rows.size:
+        return None
+
+    top, bottom = non_empty_rows[0], non_empty_rows[-1] + 1
+    # we only need to look at the columns of the rows we kept
+    non_empty_columns = np.flatnonzero(alpha[top:bottom].max(axis=0) >= alpha_threshold)
+    left, right = non_empty_columns[0], non_empty_columns[-1] + 1
+
+    return int(left), int(top), int(right), int(bottom)
+
+
+def crop_transparency(im: Image, alpha_threshold=255) -> ImageType:
+    """crops the transparent borders of the image. Returns `im` itself if there's nothing to crop.
+
+    The original code (https://stackoverflow.com/a/37942933) was filtering anything with alpha value > 0. It makes
+    sense to filter anything > 0, but in our case it doesn't work: we need to filter anything that doesn't have
+    any alpha gradient. For some reason, many stickers's transparent pixels actually have an alpha value slightly
+    above 0, so by default we keep only the rows/columns with at least a fully opaque pixel"""
+
+    return crop_to_box(im, get_alpha_bbox(im, alpha_threshold))
+
+
+def crop_to_box(im: Image, crop_box: Optional[tuple]) -> ImageType:
+    """Returns `im` itself if there's no crop box or if it is the whole image"""
+
+    if not crop_box:
+        logger.debug("no transparent areas to crop (mode: %s)", im.mode)
+        return im
+
+    if crop_box == (0, 0, im.width, im.height):
+        return im
+
+    logger.debug("crop box: %s", crop_box)
+
+    return im.crop(crop_box)
+
+
+def to_palette_lossless(im: Image) -> Optional[ImageType]:
+    """converts the image to a palette image without losing any color. Returns None if the image has
+    more than 256 colors"""
+
+    if im.mode == "P":
+        return im
+    elif im.getcolors(256) is None:
+        return None
+
+    rgba_pixels = np.asarray(im.convert("RGBA")).reshape(-1, 4)
+    # one uint32 per pixel, so np.unique() compares whole colors
+    colors, palette_indexes = np.unique(rgba_pixels.view(np.uint32).ravel(), return_inverse=True)
+
+    palette_image = Image.fromarray(palette_indexes.astype(np.uint8).reshape(im.height, im.width), "P")
+    palette_image.putpalette(colors.view(np.uint8).tobytes(), rawmode="RGBA")
 
-    # debug_print_image(image_data_bw)
+    return palette_image
 
-    # print(image_data_bw)
-    # print(np.where(image_data_bw.max(axis=0) > 0))
-    # print(im.getpixel((0, 0)))
 
-    # the original code was filtering anything with alpha vlaue > 0, see stack overflow url
-    # it makes sense to filter naything > 0, but in our case it doesn't work: we need to filter anything that
-    # doesn't have any alpha gradient. For some reason, many stickers's tranparent pixel actually have
-    # an alpha value slightly above 0
-    non_empty_columns = np.where(image_data_bw.max(axis=0) == 255)[0]  # filter columns with non-255 alpha value
-    non_empty_rows = np.where(image_data_bw.max(axis=1) == 255)[0]
+def encode(pil_image: Image, out, image_format: str, max_file_size: Optional[int] = None, profile="default") -> int:
+    """Saves the image to `out` with the settings of the `profile` encoder profile, and returns the number
+    of bytes written.
 
-    # print("non_empty_columns", non_empty_columns)
-    # print("non_empty_rows", non_empty_rows)
+    If `max_file_size` is set, we go through `SIZE_TARGETED_ENCODER_SETTINGS` until the encoded image fits.
+    If none fits, `out` contains the last (smallest) attempt: callers must check the returned size.
+    Images with up to 256 colors are always saved as png with a palette, which is lossless and smaller"""
 
-    crop_box = (min(non_empty_rows), max(non_empty_rows), min(non_empty_columns), max(non_empty_columns))
-    # print(crop_box)
+    profile_settings = ENCODER_PROFILES[profile][image_format]
 
-    image_data_new = image_data[crop_box[0]:crop_box[1] + 1, crop_box[2]:crop_box[3] + 1, :]
+    if not max_file_size:
+        pil_image.save(out, image_format, **profile_settings)
+        return out.tell()
 
-    new_image = Image.fromarray(image_data_new)
+    palette_image = to_palette_lossless(pil_image) if image_format == "png" else None
 
-    return new_image
+    size = 0
+    for settings in SIZE_TARGETED_ENCODER_SETTINGS[image_format]:
+        settings = {**profile_settings, **settings}
+        image_to_save = palette_image or pil_image
+        if settings.pop("quantize", False):
+            if palette_image:
+                continue  # already tried, it's the same as the previous step
+
+            # lossy: fast octree is the only quantization method that supports transparency
+            image_to_quantize = pil_image if pil_image.mode in ("RGB", "RGBA") else pil_image.convert("RGBA")
+            image_to_save = image_to_quantize.quantize(256, method=Image.FASTOCTREE)
+
+        out.seek(0)
+        out.truncate()
+        image_to_save.save(out, image_format, **settings)
+        size = out.tell()
+
+        logger.debug("encoded as %s (%s): %d bytes (max: %d)", image_format, settings, size, max_file_size)
+        if size <= max_file_size:
+            break
+
+    return size
 
 
 def get_correct_size(sizes, max_size):
@@ -96,21 +269,107 @@ def get_correct_size(sizes, max_size):
     return tuple(new)
 
 
-def resize_keep_rateo(pil_image: Image, size: int) -> ImageType:
-    # larger side must be 100px, the other one can be shorter
-    scaled_size = get_correct_size(pil_image.size, max_size=size)
-    pil_image = pil_image.resize(scaled_size, Image.ANTIALIAS)
-    logger.debug("scaled size: %s", pil_image.size)
+def get_decoding_memory(im: Image) -> int:
+    """returns how many bytes decoding the image will need. It only needs the image header"""
+
+    # Pillow uses 4 bytes per pixel for multi-band images, even RGB ones
+    bytes_per_pixel = 4 if len(im.getbands()) > 1 or im.mode in ("I", "F") else 1
+    return im.width * im.height * bytes_per_pixel * DECODING_MEMORY_MULTIPLIERS.get(im.format, 1)
+
+
+def get_reducing_factor(size, target_size) -> tuple:
+    """returns the (x, y) reduce() factors Image.resize() would use with `RESIZE_REDUCING_GAP`"""
+
+    return tuple(max(1, int(source / target / RESIZE_REDUCING_GAP)) for source, target in zip(size, target_size))
+
+
+def reduce_in_strips(im: Image, factor: tuple, box: Optional[tuple] = None) -> ImageType:
+    """same as im.reduce(factor, box), but the source image is read in horizontal strips of about `STRIP_PIXELS`
+    pixels. Image.reduce() makes a premultiplied copy of the whole image when it has an alpha band, here only
+    the current strip is copied. The source image itself is fully decoded when the first strip is read.
+
+    Images with an alpha band are returned premultiplied (RGBa/La, resize() accepts them): converting them back
+    would lose the precision of almost transparent pixels"""
+
+    left, top, right, bottom = box or (0, 0, im.width, im.height)
+    factor_x, factor_y = factor
+
+    # strips must start at a multiple of the factor, so they're reduced exactly like the whole image
+    strip_height = max(1, STRIP_PIXELS // (right - left) // factor_y) * factor_y
+
+    result = None
+    for strip_top in range(top, bottom, strip_height):
+        strip = im.crop((left, strip_top, right, min(strip_top + strip_height, bottom)))
+        if strip.mode not in ("L", "LA", "RGB", "RGBA", "I", "F"):
+            # reduce() doesn't support palette images
+            strip = strip.convert("RGBA")
+        if strip.mode in PREMULTIPLIED_MODES:
+            strip = strip.convert(PREMULTIPLIED_MODES[strip.mode])
+
+        reduced_strip = strip.reduce(factor)
+        strip.close()
+
+        if not result:
+            result_size = (math.ceil((right - left) / factor_x), math.ceil((bottom - top) / factor_y))
+            result = Image.new(reduced_strip.mode, result_size)
+
+        result.paste(reduced_strip, (0, (strip_top - top) // factor_y))
+        reduced_strip.close()
+
+    return result
+
+
+def resize(pil_image: Image, size, box: Optional[tuple] = None) -> ImageType:
+    """Lanczos resize. When the image is much larger than `size`, it is first shrunk by an integer factor with
+    reduce() (a cheap box filter): the final resample then works on a much smaller image.
+    Returns `pil_image` itself if it already has the requested size.
+
+    `box` is the (float) region of the image to resize, see Image.resize()"""
+
+    size = tuple(size)
+    if pil_image.size == size and not box and pil_image.mode not in UNPREMULTIPLIED_MODES:
+        return pil_image
+
+    if pil_image.mode in UNPREMULTIPLIED_MODES:
+        # already premultiplied by reduce_in_strips()
+        resized_image = pil_image.resize(size, Image.LANCZOS, box, reducing_gap=RESIZE_REDUCING_GAP)
+        return resized_image.convert(UNPREMULTIPLIED_MODES[pil_image.mode])
+
+    premultiplied_mode = PREMULTIPLIED_MODES.get(pil_image.mode)
+    if premultiplied_mode:
+        # Image.resize() ignores `reducing_gap` for images with an alpha band: do the alpha premultiplication
+        # (which it would do anyway) ourselves
+        resized_image = pil_image.convert(premultiplied_mode).resize(size, Image.LANCZOS, box, reducing_gap=RESIZE_REDUCING_GAP)
+        return resized_image.convert(pil_image.mode)
+
+    return pil_image.resize(size, Image.LANCZOS, box, reducing_gap=RESIZE_REDUCING_GAP)
+
+
+def get_box_size(box: tuple) -> tuple:
+    return box[2] - box[0], box[3] - box[1]
+
+
+def pad(pil_image: Image, size: int) -> ImageType:
+    """centers the image on a transparent `size`x`size` canvas. Returns `pil_image` itself if it already
+    has that size"""
 
     canvas_width, canvas_height = size, size
     png_width, png_height = pil_image.size
+    if (png_width, png_height) == (canvas_width, canvas_height):
+        return pil_image
+
+    x1 = int(math.floor((canvas_width - png_width) / 2))
+    y1 = int(math.floor((canvas_height - png_height) / 2))
+
+    if pil_image.mode in ("RGBA", "LA"):
+        # a crop box larger than the image pads it with transparent pixels: we do not need to create a canvas
+        # and paste the image on it
+        return pil_image.crop((-x1, -y1, canvas_width - x1, canvas_height - y1))
 
     canvas_background = (255, 255, 255, 0)
     canvas_size = (size, size)
     canvas = Image.new(pil_image.mode, canvas_size, canvas_background)
 
-    x1 = int(math.floor((canvas_width - png_width) / 2))
-    y1 = int(math.floor((canvas_height - png_height) / 2))
     x2 = x1 + png_width
     y2 = y1 + png_height
     paste_coordinates = (x1, y1, x2, y2)
@@ -118,26 +377,128 @@ def resize_keep_rateo(pil_image: Image, size: int) -> ImageType:
 
     canvas.paste(pil_image, paste_coordinates)
 
-    pil_image.close()
+    return canvas
+
+
+def resize_keep_rateo(pil_image: Image, size: int) -> ImageType:
+    # larger side must be 100px, the other one can be shorter
+    scaled_size = get_correct_size(pil_image.size, max_size=size)
+    scaled_image = resize(pil_image, scaled_size)
+    logger.debug("scaled size: %s", scaled_image.size)
+
+    canvas = pad(scaled_image, size)
+
+    if scaled_image is not pil_image and scaled_image is not canvas:
+        scaled_image.close()
 
     return canvas
 
 
+def needs_resize(size, max_size: int) -> bool:
+    # one of the sies is larger than `max_size`...
+    larger = size[0] > max_size or size[1] > max_size
+    # ...or none of the sides is `max_size`
+    return larger or (size[0] != max_size and size[1] != max_size)
+
+
+def open_image(input_file: BinaryIO, draft_size: Optional[int] = None) -> ImageType:
+    """opens the image reading only its header. Raises InvalidImage if the file is not an image Pillow can decode,
+    and ImageTooLarge if decoding it would need more than `MAX_DECODING_MEMORY`.
+
+    If `draft_size` is passed, JPEG images will be decoded at the smallest size (down to 1/8) that is not smaller
+    than `draft_size` x `draft_size`. Other formats can only be decoded at full size"""
+
+    try:
+        im = Image.open(input_file)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except UnidentifiedImageError as e:
+        raise InvalidImage(str(e))
+
+    if draft_size:
+        # a no-op for formats other than JPEG. JPEG images don't have an alpha band: cropping transparent areas
+        # doesn't need them at full size
+        im.draft(im.mode, (draft_size, draft_size))
+
+    # Image.open() only reads the header: we can refuse the image before allocating anything
+    decoding_memory = get_decoding_memory(im)
+    if decoding_memory > MAX_DECODING_MEMORY:
+        im.close()
+        raise ImageTooLarge("{}x{} {} {} image: {} bytes needed to decode it".format(
+            im.width, im.height, im.mode, im.format, decoding_memory
+        ))
+
+    return im
+
+
+def get_sticker_issues(input_file: BinaryIO, file_size: int, options: Options) -> List[str]:
+    """Checks whether Telegram would accept the file as a static sticker without processing it with `options`:
+    it must be a still `options.image_format` image, one of its sides must be exactly `options.max_size` and the
+    other one must not be longer, and the file must not exceed `options.max_file_size` bytes.
+
+    Only the image header is read. Returns the reasons why the image must be processed before being uploaded
+    (an empty list if it can be uploaded as it is). Raises the exceptions of open_image()"""
+
+    input_file.seek(0)
+    im = open_image(input_file)
+
+    issues = []
+    if im.format != options.image_format.upper():
+        issues.append("{} image, expected {}".format(im.format, options.image_format))
+    if getattr(im, "is_animated", False):
+        # only the first frame is kept when the image is encoded again
+        issues.append("animated image")
+    if needs_resize(im.size, options.max_size):
+        issues.append("size is {}x{}, one side must be {} px".format(im.width, im.height, options.max_size))
+    if options.max_file_size and file_size > options.max_file_size:
+        issues.append("file is {} bytes, max {}".format(file_size, options.max_file_size))
+
+    # im.close() would also close `input_file`: the caller still needs it
+    input_file.seek(0)
+
+    return issues
+
+
+class Plan:
+    """the operations File.process() runs on the image. They are decided before touching the image's pixels
+    (except to find the crop box), so steps that would do nothing are skipped and crop + reduce can be done
+    in a single pass"""
+
+    def __init__(self, crop_box: Optional[tuple], reduce_factor: tuple, resize_size: Optional[tuple], canvas_size: Optional[int]):
+        # region of the image to keep, None to keep all of it
+        self.crop_box = crop_box
+        # (x, y) factors of the reduce() step done before the final resample (see RESIZE_REDUCING_GAP)
+        self.reduce_factor = reduce_factor
+        # size of the resampled image, None if the image already has the right size
+        self.resize_size = resize_size
+        # size of the transparent square the resized image must be centered on, None if it doesn't need padding
+        self.canvas_size = canvas_size
+
+    def __str__(self):
+        return f"crop_box: {self.crop_box}; reduce_factor: {self.reduce_factor}; resize_size: {self.resize_size}; " \
+               f"canvas_size: {self.canvas_size}"
+
+
 class File:
     def __init__(self, input_image_bo: tempfile.SpooledTemporaryFile, options: Optional[Options] = None):
         self.input_image_bo = input_image_bo
         self.options = options or Options()
-        self.pil_image: Image = Image.open(self.input_image_bo)
+        self.pil_image: Image = open_image(self.input_image_bo, draft_size=self.options.max_size)
+
         self.result_tempfile = tempfile.SpooledTemporaryFile()
+        self.result_format = None  # format of the image encoded in `result_tempfile`, None if nothing was encoded
+        self.result_size = 0
 
     def sticker_needs_resize(self, options: Optional[Options] = None):
         options = options or self.options  # maybe options were overridden by self.process()
-        size = self.pil_image.size
 
-        # one of the sies is larger than `max_size`...
-        needs_resize = size[0] > options.max_size or size[1] > options.max_size
-        # ...or none of the sides is `max_size`
-        return needs_resize or (size[0] != options.max_size and size[1] != options.max_size)
+        return needs_resize(self.pil_image.size, options.max_size)
+
+    def replace_image(self, new_image: Image):
+        # free the memory used by the previous (usually much larger) image as soon as we can
+        if new_image is not self.pil_image:
+            self.pil_image.close()
+            self.pil_image = new_image
 
     def process(self, options: Optional[Options] = None):
         options = options or self.options  # allow to override options
@@ -149,43 +510,104 @@ class File:
         if options.keep_aspect_rateo and not options.square:
             raise ValueError("`keep_aspect_rateo` is set to True, but `square` is not")
 
+        plan = self.plan(options)
+        logger.debug("plan -> %s", plan)
+
+        self._run_plan(plan)
+
+        self._encode(options.image_format, options.max_file_size, options.encoder_profile)
+
+        return self.result_tempfile
+
+    def plan(self, options: Optional[Options] = None) -> Plan:
+        options = options or self.options
+
+        crop_box = None
         if options.crop_transparent_areas:
-            self.pil_image = crop_transparency(self.pil_image)
+            crop_box = get_alpha_bbox(self.pil_image, options.alpha_threshold)
+            if crop_box == (0, 0, self.pil_image.width, self.pil_image.height):
+                crop_box = None
+
+        size = get_box_size(crop_box) if crop_box else self.pil_image.size
 
-        if is_square(self.pil_image) or (options.square and not options.keep_aspect_rateo):
+        canvas_size = None
+        if size[0] == size[1] or (options.square and not options.keep_aspect_rateo):
             # two secnarios:
             # - if the image is a square, just resize to the desired `max_size`
             # - if the image is not a square BUT we want a square and we don't care about the aspect rateo,
             #   just resize to the desired `max_size`
-            self.pil_image = self.pil_image.resize((options.max_size, options.max_size), Image.ANTIALIAS)
+            resize_size = (options.max_size, options.max_size)
         elif options.square and options.keep_aspect_rateo:
             # if the image is not a square but we want a square AND we want to keep the size rateo
-            self.pil_image = resize_keep_rateo(self.pil_image, options.max_size)
-        else:
+            resize_size = get_correct_size(size, max_size=options.max_size)
+            canvas_size = options.max_size
+        elif needs_resize(size, options.max_size):
             # the image is not a square, and we don't need it to be a square,
             # just make sure the largest size is `max_size`
-            if self.sticker_needs_resize(options):
-                correct_size = get_correct_size(self.pil_image.size, max_size=options.max_size)
-                self.pil_image = self.pil_image.resize(correct_size, Image.ANTIALIAS)
+            resize_size = get_correct_size(size, max_size=options.max_size)
+        else:
+            resize_size = None
+
+        if resize_size == tuple(size):
+            resize_size = None
 
-        self.pil_image.save(self.result_tempfile, options.image_format)
+        reduce_factor = get_reducing_factor(size, resize_size) if resize_size else (1, 1)
 
+        return Plan(crop_box, reduce_factor, resize_size, canvas_size)
+
+    def _run_plan(self, plan: Plan):
+        size = get_box_size(plan.crop_box) if plan.crop_box else self.pil_image.size
+
+        resize_box = None
+        if plan.reduce_factor != (1, 1) and size[0] * size[1] > STRIP_PIXELS:
+            # crop and reduce() in a single pass over the decoded image, one strip at a time: no other full-size
+            # copy of the image is made. Smaller images fit in a single strip, resize() will reduce them
+            self.replace_image(reduce_in_strips(self.pil_image, plan.reduce_factor, plan.crop_box))
+            # reduce() rounds the size up: the final resample must only use the region matching the source image
+            resize_box = (0, 0, size[0] / plan.reduce_factor[0], size[1] / plan.reduce_factor[1])
+        elif plan.crop_box:
+            # resampling the full image with the crop box as source region would be slower: the alpha of the whole
+            # image would have to be premultiplied, not just the one of the cropped area
+            self.replace_image(crop_to_box(self.pil_image, plan.crop_box))
+
+        if plan.resize_size:
+            self.replace_image(resize(self.pil_image, plan.resize_size, resize_box))
+
+        if plan.canvas_size:
+            self.replace_image(pad(self.pil_image, plan.canvas_size))
+
+    def _encode(self, image_format, max_file_size=None, encoder_profile="default"):
         self.result_tempfile.seek(0)
+        self.result_tempfile.truncate()
 
-        return self.result_tempfile
+        self.result_size = encode(self.pil_image, self.result_tempfile, image_format, max_file_size, encoder_profile)
+        self.result_format = image_format
 
-    def clone_result_tempfile(self, image_format=None, then_close=False):
+        self.result_tempfile.seek(0)
+
+    def take_result_tempfile(self, image_format=None, then_close=False):
+        """returns the tempfile with the encoded image. The image is not encoded again if process() already
+        encoded it in `image_format`.
+
+        The tempfile is handed over to the caller, which is responsible for closing it: this object will use
+        a new one if needed"""
         image_format = image_format or self.options.image_format
 
-        new_tempfile = tempfile.SpooledTemporaryFile()
-        self.pil_image.save(new_tempfile, image_format)
+        if self.result_format != image_format:
+            logger.debug("encoding result as %s (encoded format: %s)", image_format, self.result_format)
+            self._encode(image_format, self.options.max_file_size, self.options.encoder_profile)
+
+        result_tempfile = self.result_tempfile
+        result_tempfile.seek(0)
+
+        self.result_tempfile = tempfile.SpooledTemporaryFile()
+        self.result_format = None
+        self.result_size = 0
 
         if then_close:
             self.close()
 
-        new_tempfile.seek(0)
-
-        return new_tempfile
+        return result_tempfile
 
     def close(self):
         logger.debug("closing ImageFile...")
@@ -0,0 +1,155 @@
+import io
+import logging
+import multiprocessing
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import BinaryIO, Optional, Tuple
+
+from config import config
+from . import image
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePoolFull(Exception):
+    pass
+
+
+def _untrack(shared_memory: SharedMemory):
+    # the block will be unlinked by the parent process: the worker's resource tracker must not unlink it
+    # when the worker exits (https://bugs.python.org/issue39959)
+    # noinspection PyProtectedMember
+    resource_tracker.unregister(shared_memory._name, "shared_memory")
+
+
+def _process_image(input_name: str, input_size: int, options: image.Options, only_if_needed: bool) -> Optional[Tuple[str, int]]:
+    """Executed in the worker processes. Reads the image from the `input_name` shared memory block, and returns
+    the name and size of a new block containing the encoded result (or None if the image didn't need to be processed).
+    The caller must unlink the returned block"""
+
+    input_memory = SharedMemory(name=input_name)
+    _untrack(input_memory)
+    try:
+        im = image.File(io.BytesIO(input_memory.buf[:input_size]), options)
+    finally:
+        input_memory.close()
+
+    try:
+        if only_if_needed and not im.sticker_needs_resize():
+            return None
+
+        result = im.process()
+        result_size = im.result_size
+        if not result_size:
+            return None
+
+        output_memory = SharedMemory(create=True, size=result_size)
+        _untrack(output_memory)
+        try:
+            result.readinto(output_memory.buf[:result_size])
+        except BaseException:
+            output_memory.close()
+            output_memory.unlink()
+            raise
+
+        output_memory.close()
+
+        return output_memory.name, result_size
+    finally:
+        im.close()
+
+
+class ImagePool:
+    """Runs image.File.process() in a pool of worker processes, so that large images do not use the cpu time of
+    the threads that handle the updates. Images are passed to/from the workers through shared memory.
+
+    At most `workers + max_queued` images can be waiting to be processed, `process()` raises `ImagePoolFull`
+    if the limit has been reached. If `workers` is 0, images are processed by the calling thread"""
+
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(workers + max_queued) if workers else None
+
+    def start(self):
+        """Starts the worker processes. They are forked from the current process, so this should be called
+        before other threads are started"""
+        if not self.workers or self._executor:
+            return
+
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+        # the workers are started on the first submit
+        self._executor.submit(int).result()
+        logger.info("image pool started with %d workers", self.workers)
+
+    @staticmethod
+    def _process_locally(input_file: BinaryIO, options: image.Options, only_if_needed: bool):
+        im = image.File(input_file, options)
+        if only_if_needed and not im.sticker_needs_resize():
+            im.close()
+            return None
+
+        im.process()
+        return im.take_result_tempfile(then_close=True)
+
+    def process(self, input_file: BinaryIO, options: image.Options, only_if_needed=False) -> Optional[tempfile.SpooledTemporaryFile]:
+        """Processes the image and returns a new tempfile with the encoded result, which must be closed by
+        the caller. If `only_if_needed` is True, returns None when the image doesn't need to be resized"""
+
+        input_file.seek(0)
+
+        if not self._executor:
+            return self._process_locally(input_file, options, only_if_needed)
+
+        if not self._slots.acquire(blocking=False):
+            raise ImagePoolFull("too many images are waiting to be processed")
+
+        try:
+            input_data = input_file.read()
+            input_size = len(input_data)
+            input_file.seek(0)
+
+            input_memory = SharedMemory(create=True, size=max(input_size, 1))
+            try:
+                input_memory.buf[:input_size] = input_data
+                del input_data
+
+                result = self._executor.submit(_process_image, input_memory.name, input_size, options, only_if_needed).result()
+            finally:
+                input_memory.close()
+                input_memory.unlink()
+        except BrokenProcessPool:
+            # a worker died (eg. killed because it was using too much memory)
+            logger.error("the image pool is broken, images will be processed by the calling threads", exc_info=True)
+            self._executor = None
+            raise
+        finally:
+            self._slots.release()
+
+        if not result:
+            return None
+
+        output_name, output_size = result
+        output_memory = SharedMemory(name=output_name)
+        try:
+            result_tempfile = tempfile.SpooledTemporaryFile()
+            shutil.copyfileobj(io.BytesIO(output_memory.buf[:output_size]), result_tempfile)
+        finally:
+            output_memory.close()
+            output_memory.unlink()
+
+        result_tempfile.seek(0)
+
+        return result_tempfile
+
+
+pool = ImagePool(
+    workers=config.get('images', {}).get('workers', 2),
+    max_queued=config.get('images', {}).get('max_queued', 20)
+)
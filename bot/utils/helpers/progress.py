@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+
+# noinspection PyPackageRequirements
+from telegram import Message, ParseMode
+# noinspection PyPackageRequirements
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressReporter:
+    """Edits progress messages on behalf of long operations. Operations call `report()`, which never blocks: only the
+    latest text of each message is kept, and a background thread edits each message at most once every `interval`
+    seconds"""
+
+    def __init__(self, interval: float = 3.0):
+        self.interval = interval
+        self._pending = dict()  # (chat_id, message_id) -> [message, text, parse_mode, is_last_update]
+        self._last_edit = dict()  # (chat_id, message_id) -> time of the last edit (or of the earliest allowed edit)
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @staticmethod
+    def _key(message: Message):
+        return message.chat_id, message.message_id
+
+    def _start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._thread = threading.Thread(target=self._run, name='ProgressReporter', daemon=True)
+        self._thread.start()
+
+    def report(self, message: Message, text: str, parse_mode=ParseMode.HTML):
+        """Schedules an edit of `message`. If another edit of the same message is pending, it is replaced"""
+        with self._condition:
+            self._start()
+            self._pending[self._key(message)] = [message, text, parse_mode, False]
+            self._condition.notify()
+
+    def done(self, message: Message, text: str = None, parse_mode=ParseMode.HTML):
+        """The operation ended: the last text (if passed) will be the last edit, then the message is forgotten"""
+        key = self._key(message)
+        with self._condition:
+            if text is not None:
+                self._start()
+                self._pending[key] = [message, text, parse_mode, True]
+                self._condition.notify()
+            elif key in self._pending:
+                self._pending[key][3] = True
+            else:
+                self._last_edit.pop(key, None)
+
+    def _next_due(self):
+        """returns the key of the next message to edit and the seconds we have to wait before editing it"""
+        now = time.monotonic()
+        next_key, next_wait = None, None
+        for key in self._pending:
+            wait = self._last_edit.get(key, 0) + self.interval - now
+            if next_wait is None or wait < next_wait:
+                next_key, next_wait = key, wait
+
+        return next_key, next_wait
+
+    def _run(self):
+        while True:
+            with self._condition:
+                key, wait = self._next_due()
+                if key is None:
+                    self._condition.wait()
+                    continue
+                elif wait > 0:
+                    self._condition.wait(wait)
+                    continue
+
+                message, text, parse_mode, is_last_update = self._pending.pop(key)
+                self._last_edit[key] = time.monotonic()
+                if is_last_update:
+                    self._last_edit.pop(key, None)
+
+            try:
+                message.edit_text(text, parse_mode=parse_mode)
+            except RetryAfter as e:
+                logger.warning('flood wait while editing a progress message: retrying in %d seconds', e.retry_after)
+                with self._condition:
+                    # do not override a more recent update
+                    self._pending.setdefault(key, [message, text, parse_mode, is_last_update])
+                    self._last_edit[key] = time.monotonic() + e.retry_after
+            except (TelegramError, BadRequest) as e:
+                logger.warning('error while editing progress message: %s', e.message)
+            except Exception as e:
+                logger.error('unexpected error while editing progress message: %s', str(e), exc_info=True)
+
+
+reporter = ProgressReporter(interval=config.get('bot', {}).get('progress_edit_interval', 3))
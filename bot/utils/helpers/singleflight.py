@@ -0,0 +1,40 @@
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key: the first caller executes the function, callers that arrive
+    while it is running wait for it and receive the same result (or exception). Results are not cached: once the
+    call returns, the next caller will execute the function again"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()  # key -> Future of the running call
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs):
+        with self._lock:
+            call: Future = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = Future()
+                self._calls[key] = call
+
+        if not is_leader:
+            logger.debug('waiting for the running call with key %s', key)
+            return call.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
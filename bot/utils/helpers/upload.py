@@ -0,0 +1,165 @@
+import logging
+import queue
+import threading
+import uuid
+from typing import Iterable, Callable, Union, Optional
+
+# noinspection PyPackageRequirements
+from telegram import Bot, Message
+# noinspection PyPackageRequirements
+from telegram.vendor.ptb_urllib3.urllib3 import Timeout
+
+logger = logging.getLogger(__name__)
+
+
+class StreamPipe:
+    """A bounded in-memory pipe: one thread writes bytes into it (eg. a `zipfile.ZipFile`), another thread
+    iterates over the written chunks (eg. an http request body). It is not seekable, so `zipfile` will write
+    data descriptors instead of seeking back to patch the entries' headers.
+
+    When the buffer is full the writer blocks, so the memory used is at most `max_chunks * chunk_size` bytes"""
+
+    POLL_INTERVAL = 1  # seconds
+
+    def __init__(self, chunk_size=64 * 1024, max_chunks=16):
+        self.chunk_size = chunk_size
+        self.bytes_written = 0
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._buffer = bytearray()
+        self._eof = False
+        self._aborted = threading.Event()
+
+    def _put(self, chunk: Optional[bytes]):
+        while True:
+            if self._aborted.is_set():
+                raise BrokenPipeError('the stream has been aborted')
+
+            try:
+                self._queue.put(chunk, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data) -> int:
+        if self._eof:
+            raise ValueError('write to closed stream')
+
+        self._buffer += data
+        self.bytes_written += len(data)
+
+        while len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer[:self.chunk_size]))
+            del self._buffer[:self.chunk_size]
+
+        return len(data)
+
+    def flush(self):
+        # we do not flush incomplete chunks: they would just make the http body chunks smaller
+        pass
+
+    def close(self):
+        """Called by the writer when it has nothing left to write"""
+        if self._eof:
+            return
+
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+        self._put(None)
+        self._eof = True
+
+    def abort(self):
+        """Can be called by both sides: the other one will raise BrokenPipeError"""
+        self._aborted.set()
+
+    def __iter__(self):
+        completed = False
+        try:
+            while True:
+                if self._aborted.is_set():
+                    raise BrokenPipeError('the stream has been aborted')
+
+                try:
+                    chunk = self._queue.get(timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+
+                if chunk is None:
+                    completed = True
+                    return
+
+                yield chunk
+        finally:
+            if not completed:
+                # the reader stopped before the end of the stream: do not let the writer wait forever
+                self.abort()
+
+
+def send_document_stream(
+        bot: Bot,
+        chat_id: int,
+        document: Iterable[bytes],
+        filename: str,
+        fields: Union[dict, Callable[[], dict], None] = None,
+        timeout: int = 60
+) -> Message:
+    """Executes a sendDocument request whose multipart body is streamed (chunked transfer encoding) while
+    `document` is being iterated, so the file doesn't need to be on disk or in memory.
+
+    The document is sent before the other form fields: `fields` can be a callable that is called once the
+    document has been streamed, so it can return values that were not known when the upload started
+    (eg. a caption with the number of skipped files)"""
+
+    boundary = uuid.uuid4().hex
+
+    def form_field(name, value):
+        return ('--{}\r\nContent-Disposition: form-data; name="{}"\r\n\r\n{}\r\n'.format(boundary, name, value)).encode()
+
+    def body():
+        yield form_field('chat_id', chat_id)
+        yield ('--{}\r\nContent-Disposition: form-data; name="document"; filename="{}"\r\n'
+               'Content-Type: application/octet-stream\r\n\r\n'.format(boundary, filename)).encode()
+        yield from document
+        yield b'\r\n'
+
+        extra_fields = fields() if callable(fields) else fields
+        for name, value in (extra_fields or {}).items():
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                value = str(value).lower()
+
+            yield form_field(name, value)
+
+        yield '--{}--\r\n'.format(boundary).encode()
+
+    # sent through the bot's connection pool like any other request, so it uses the same proxy (`proxy_url` or the
+    # HTTPS_PROXY environment variable) and raises the same TelegramErrors. It is not retried: the body can't be
+    # streamed twice
+    request = bot.request
+    body_generator = body()
+    try:
+        # noinspection PyProtectedMember
+        response_body = request._request_wrapper(
+            'POST',
+            '{}/sendDocument'.format(bot.base_url),
+            body=body_generator,
+            headers={'Content-Type': 'multipart/form-data; boundary={}'.format(boundary)},
+            chunked=True,
+            retries=False,
+            timeout=Timeout(connect=request._connect_timeout, read=timeout)
+        )
+    except Exception:
+        if isinstance(document, StreamPipe):
+            document.abort()  # the request might have failed before the body was consumed: unblock the writer
+        raise
+    finally:
+        body_generator.close()
+
+    # noinspection PyProtectedMember
+    result = request._parse(response_body)
+
+    logger.debug('<sendDocument> successfully executed (streamed)')
+
+    return Message.de_json(result, bot)
@@ -1,4 +1,8 @@
 import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional
 
 from pyrogram import Client
 from pyrogram import Sticker
@@ -10,6 +14,8 @@ from pyrogram.api.types import DocumentAttributeFilename
 # noinspection PyPackageRequirements
 from telegram import Message
 
+from .helpers import fileid
+from .helpers import singleflight
 from .helpers.utils import get_emojis_from_message
 from config import config
 
@@ -50,9 +56,23 @@ def unpack_document_attributes(document):
     return sticker_attributes, image_size_attributes, file_name
 
 
-def get_set_emojis_dict(set_name: str) -> dict:
-    input_sticker_set_short_name = InputStickerSetShortName(short_name=set_name)
-    sticker_set = client.send(GetStickerSet(stickerset=input_sticker_set_short_name))
+def index_sticker_set_emojis(sticker_set) -> dict:
+    """returns a dict document id -> list of the emojis of that sticker"""
+
+    emojis_by_document_id = defaultdict(list)
+
+    # each pack in sticker_set.packs is an emoji. A pack has a 'documents' attribute, which contains
+    # a list of document ids bound to that emoji
+    for emoji in sticker_set.packs:
+        for document_id in emoji.documents:
+            emojis_by_document_id[document_id].append(emoji.emoticon)
+
+    return dict(emojis_by_document_id)
+
+
+def parse_sticker_set(sticker_set, emojis_by_document_id: Optional[dict] = None) -> dict:
+    if emojis_by_document_id is None:
+        emojis_by_document_id = index_sticker_set_emojis(sticker_set)
 
     result_dict = dict()
 
@@ -70,70 +90,173 @@ def get_set_emojis_dict(set_name: str) -> dict:
             client=client
         )
 
+        # logger.debug('id: %d', document.id)
+        # logger.debug('main: %s', sticker_attributes.alt)  # 'alt' actually contains the pack's main emoji
+
         result_dict[sticker.file_id] = dict(
             file_id=sticker.file_id,
-            document_id=document.id
+            document_id=document.id,
+            emojis=list(emojis_by_document_id.get(document.id, []))
         )
 
-        # logger.debug('id: %d', document.id)
-        # logger.debug('main: %s', sticker_attributes.alt)  # 'alt' actually contains the pack's main emoji
-
-        # each pack in sticker_set.packs is an emoji. A pack has a 'documents' attribute, which contains
-        # a list of document ids bound to that emoji
-        all_sticker_emojis = list()
-        for emoji in sticker_set.packs:
-            for document_id in emoji.documents:
-                if document_id == document.id:
-                    all_sticker_emojis.append(emoji.emoticon)
+    return result_dict
 
-        # logger.debug('all: %s', all_sticker_emojis)
-        result_dict[sticker.file_id]['emojis'] = all_sticker_emojis
 
-    return result_dict
+class CachedStickerSet:
+    def __init__(self, sticker_set):
+        self.set_hash = sticker_set.set.hash
+        # document id -> emojis: the document id can be read from a Bot API file_id (see fileid.get_document_id())
+        self.emojis_by_document_id = index_sticker_set_emojis(sticker_set)
+        self.fetched_at = time.monotonic()
+        self._sticker_set = sticker_set
+        self._emojis_dict = None
+        self._lock = threading.Lock()
+
+    @property
+    def emojis_dict(self) -> dict:
+        """the set's emojis dict (see parse_sticker_set()). Parsing all the documents is needed only by /export:
+        it's done the first time the dict is requested"""
+
+        with self._lock:
+            if self._emojis_dict is None:
+                self._emojis_dict = parse_sticker_set(self._sticker_set, self.emojis_by_document_id)
+                self._sticker_set = None  # not needed anymore
+
+            return self._emojis_dict
+
+
+class StickerSetsCache:
+    """Remembers the emojis (see CachedStickerSet) of the last `max_entries` sticker sets we requested, so
+    adding many stickers from the same pack doesn't request the pack every time. A set is requested again once it
+    has been cached for `ttl` seconds: if its hash didn't change, the cached set is kept. Concurrent requests of the
+    same set are coalesced.
+
+    A set is never requested more than once every `MIN_REQUEST_INTERVAL` seconds, even when a refresh is forced:
+    lookups that miss (eg. a file_id whose document is not in the set) would otherwise request it every time.
+    For the same reason, a failed request (eg. the set has been deleted) is remembered for that time, and its
+    exception raised again"""
+
+    MIN_REQUEST_INTERVAL = 10  # seconds
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._sets = OrderedDict()  # set name -> CachedStickerSet, least recently used first
+        self._fetches = singleflight.SingleFlight()
+        self._failures = dict()  # set name -> (time of the failed request, exception)
+
+    def _get_cached(self, set_name: str) -> Optional[CachedStickerSet]:
+        with self._lock:
+            cached_set = self._sets.get(set_name)
+            if cached_set:
+                self._sets.move_to_end(set_name)
+
+            return cached_set
+
+    def _save(self, set_name: str, cached_set: CachedStickerSet):
+        if not self.max_entries:
+            return
+
+        with self._lock:
+            self._sets[set_name] = cached_set
+            self._sets.move_to_end(set_name)
+            while len(self._sets) > self.max_entries:
+                self._sets.popitem(last=False)
+
+    def _save_failure(self, set_name: str, exception: Exception):
+        now = time.monotonic()
+        with self._lock:
+            # forget the expired failures, so the dict doesn't grow
+            for name in [n for n, (failed_at, _) in self._failures.items() if now - failed_at >= self.MIN_REQUEST_INTERVAL]:
+                del self._failures[name]
+
+            self._failures[set_name] = (now, exception)
+
+    def _get_recent_failure(self, set_name: str) -> Optional[Exception]:
+        with self._lock:
+            failed_at, exception = self._failures.get(set_name, (0, None))
+
+        if exception and time.monotonic() - failed_at < self.MIN_REQUEST_INTERVAL:
+            return exception
+
+    def _fetch(self, set_name: str) -> CachedStickerSet:
+        input_sticker_set_short_name = InputStickerSetShortName(short_name=set_name)
+        try:
+            sticker_set = client.send(GetStickerSet(stickerset=input_sticker_set_short_name))
+        except Exception as e:
+            self._save_failure(set_name, e)
+            raise
+
+        cached_set = self._get_cached(set_name)
+        if cached_set and cached_set.set_hash == sticker_set.set.hash:
+            # keep the cached set, so its documents are not parsed again
+            logger.debug('sticker set %s not modified', set_name)
+            cached_set.fetched_at = time.monotonic()
+        else:
+            cached_set = CachedStickerSet(sticker_set)
+
+        self._save(set_name, cached_set)
+
+        return cached_set
+
+    def get(self, set_name: str, refresh=False) -> CachedStickerSet:
+        """returns the cached set, whose dicts must not be modified. If `refresh` is True, the set is requested
+        even if the cached one didn't expire, unless it has been requested less than `MIN_REQUEST_INTERVAL`
+        seconds ago"""
+
+        cached_set = self._get_cached(set_name)
+        if cached_set:
+            age = time.monotonic() - cached_set.fetched_at
+            if age < self.ttl and (not refresh or age < self.MIN_REQUEST_INTERVAL):
+                return cached_set
 
+        recent_failure = self._get_recent_failure(set_name)
+        if recent_failure:
+            logger.debug('sticker set %s: the last request failed less than %d seconds ago', set_name, self.MIN_REQUEST_INTERVAL)
+            raise recent_failure
+
+        return self._fetches.do(set_name, self._fetch, set_name)
 
-def get_emojis_from_pack(message: Message) -> list:
-    if isinstance(client, FakeClient):
-        return [message.sticker.emoji]
 
-    sticker = client.get_messages(message.chat.id, message.message_id).sticker
+sticker_sets = StickerSetsCache(
+    ttl=config.get('pyrogram', {}).get('sets_cache_ttl', 300),
+    max_entries=config.get('pyrogram', {}).get('sets_cache_max_entries', 200)
+)
 
-    input_sticker_set_short_name = InputStickerSetShortName(short_name=message.sticker.set_name)
-    sticker_set = client.send(GetStickerSet(stickerset=input_sticker_set_short_name))
-    # print(sticker_set.documents)
 
-    for document in sticker_set.documents:
-        # sticker_set.documents: list of stickers in the pack
+def get_set_emojis_dict(set_name: str) -> dict:
+    return sticker_sets.get(set_name).emojis_dict
 
-        sticker_attributes, image_size_attributes, file_name = unpack_document_attributes(document)
 
-        # noinspection PyProtectedMember
-        pack_sticker = Sticker._parse(
-            sticker=document,
-            image_size_attributes=image_size_attributes,
-            sticker_attributes=sticker_attributes,
-            file_name=file_name,
-            client=client
-        )
-        if pack_sticker.file_id != sticker.file_id:
-            # these two won't be the same: one is from pyrogram, the other one is from the bot api
-            # logger.debug('file_id match failed: %s', pack_sticker.file_id)
-            continue
+def get_set_hash(set_name: str) -> int:
+    """returns the current hash of the set, which changes whenever the set is modified (eg. when the emojis of
+    a sticker are edited). The set is always requested, and the cache is updated"""
 
-        # logger.debug('id: %d', document.id)
-        # logger.debug('main: %s', sticker_attributes.alt)  # 'alt' actually contains the pack's main emoji
+    return sticker_sets.get(set_name, refresh=True).set_hash
 
-        # each pack in sticker_set.packs is an emoji. A pack has a 'documents' attribute, which contains
-        # a list of document ids bound to that emoji
-        all_sticker_emojis = list()
-        for emoji in sticker_set.packs:
-            for document_id in emoji.documents:
-                if document_id == document.id:
-                    all_sticker_emojis.append(emoji.emoticon)
 
-        logger.debug('all: %s', all_sticker_emojis)
+def get_emojis_from_pack(message: Message) -> list:
+    if isinstance(client, FakeClient):
+        return [message.sticker.emoji]
 
-        return all_sticker_emojis
+    try:
+        # the Bot API file_id contains the id of the sticker's document: we can match it with the set's documents
+        document_id = fileid.get_document_id(message.sticker.file_id)
+    except fileid.InvalidFileId as e:
+        logger.warning('cannot decode the sticker\'s file_id, getting it with pyrogram: %s', str(e))
+        sticker = client.get_messages(message.chat.id, message.message_id).sticker
+        document_id = fileid.get_document_id(sticker.file_id)
+
+    cached_set = sticker_sets.get(message.sticker.set_name)
+    if document_id not in cached_set.emojis_by_document_id:
+        # the sticker might have been added to the set after we cached it
+        cached_set = sticker_sets.get(message.sticker.set_name, refresh=True)
+
+    emojis = cached_set.emojis_by_document_id.get(document_id)
+    logger.debug('all: %s', emojis)
+
+    return emojis
 
 
 def get_sticker_emojis(message: Message, use_pyrogram=True) -> list:
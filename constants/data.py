@@ -1,2 +1,2 @@
 class TemporaryKeys:
-    USER_DATA = ("pack", "crop", "ignore_rateo", "png")
+    USER_DATA = ("pack", "crop", "ignore_rateo", "png", "export_new")
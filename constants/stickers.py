@@ -16,6 +16,12 @@ class MaxPackSize:
     VIDEO = 120
 
 
+# max size of the file of a static sticker
+MAX_STATIC_STICKER_FILE_SIZE = 512 * 1024
+
+# one side of a static sticker must be exactly this long (in px), the other one must not be longer
+STATIC_STICKER_SIZE = 512
+
 STICKER_TYPE_DESC = {
     StickerType.STATIC: "static",
     StickerType.ANIMATED: "animated",
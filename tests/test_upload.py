@@ -0,0 +1,126 @@
+"""Tests for bot/utils/helpers/upload.py.
+
+Usage (from the project root): python -m unittest discover tests"""
+
+import json
+import os
+import sys
+import threading
+import types
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+# noinspection PyPackageRequirements
+from telegram import Bot
+# noinspection PyPackageRequirements
+from telegram.utils.request import Request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+# register the packages without executing their __init__: importing the `bot` package would start the whole bot
+for package_name, package_path in (("bot", "bot"), ("bot.utils", os.path.join("bot", "utils")), ("bot.utils.helpers", os.path.join("bot", "utils", "helpers"))):
+    package = types.ModuleType(package_name)
+    package.__path__ = [os.path.join(ROOT, package_path)]
+    sys.modules[package_name] = package
+
+from bot.utils.helpers import upload  # noqa: E402
+
+TOKEN = "123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+# a host that doesn't resolve: the request can only succeed if it goes through the proxy
+BASE_URL = "http://api.telegram.invalid/bot"
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    """A forward proxy that answers the requests itself, as if it was the Bot API server"""
+
+    def read_chunked_body(self) -> bytes:
+        body = bytearray()
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            if size == 0:
+                self.rfile.readline()
+                return bytes(body)
+
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def do_POST(self):
+        self.server.requests.append(dict(
+            path=self.path,
+            transfer_encoding=self.headers.get("Transfer-Encoding"),
+            body=self.read_chunked_body()
+        ))
+
+        response = json.dumps(dict(ok=True, result=dict(
+            message_id=1,
+            date=1600000000,
+            chat=dict(id=42, type="private"),
+            document=dict(file_id="file_id", file_unique_id="file_unique_id")
+        ))).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class SendDocumentStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.proxy = ThreadingHTTPServer(("127.0.0.1", 0), ProxyHandler)
+        self.proxy.requests = []
+        self.proxy_url = "http://127.0.0.1:{}".format(self.proxy.server_address[1])
+        threading.Thread(target=self.proxy.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.proxy.shutdown()
+        self.proxy.server_close()
+
+    def send_document(self, bot: Bot):
+        pipe = upload.StreamPipe(chunk_size=4)
+
+        def write():
+            pipe.write(b"zip file content")
+            pipe.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        message = upload.send_document_stream(bot, 42, pipe, "pack.zip", fields=lambda: dict(caption="pack"))
+        writer.join()
+
+        return message
+
+    def assert_sent_through_proxy(self):
+        self.assertEqual(len(self.proxy.requests), 1)
+
+        request = self.proxy.requests[0]
+        self.assertEqual(request["path"], "{}{}/sendDocument".format(BASE_URL, TOKEN))
+        self.assertEqual(request["transfer_encoding"], "chunked")
+        self.assertIn(b'filename="pack.zip"', request["body"])
+        self.assertIn(b"zip file content", request["body"])
+        self.assertIn(b'name="caption"\r\n\r\npack\r\n', request["body"])
+
+    def test_uses_proxy_url(self):
+        bot = Bot(TOKEN, base_url=BASE_URL, request=Request(proxy_url=self.proxy_url))
+
+        message = self.send_document(bot)
+
+        self.assert_sent_through_proxy()
+        self.assertEqual(message.document.file_id, "file_id")
+
+    def test_uses_https_proxy_environment_variable(self):
+        with mock.patch.dict(os.environ, {"HTTPS_PROXY": self.proxy_url}):
+            bot = Bot(TOKEN, base_url=BASE_URL, request=Request())
+
+        self.send_document(bot)
+
+        self.assert_sent_through_proxy()
+
+
+if __name__ == "__main__":
+    unittest.main()